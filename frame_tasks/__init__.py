@@ -1,5 +1,5 @@
 from .decorator import *
 from .serve import executor
 from .serve_all import app as task_view_app
-from .solve import Executor, find_path
+from .solve import Executor, LazyExecutor, MultiExecutor, StreamExecutor, find_path
 from .tasks import TaskCaller, test_call
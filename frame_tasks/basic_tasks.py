@@ -1,105 +1,209 @@
-import glob
 import re
 import pathlib
 
+import numpy as np
 import pandas as pd
 import frame_tasks as tada
+from frame_tasks.ingest import file_reader
+from frame_tasks.ragged import RaggedFrame, concat_frames
+from frame_tasks.sketch import SKETCH_EPSILON, SpaceSaving
 
 pat = re.compile
 any_name = pat(r"(.+)")
 
 
-@tada.new_task()
+@tada.new_task(mutates_input=False)
 @tada.makes(["usenet.path"], appends=False)
 @tada.close_task()
 def get_paths(expects, **kwargs):
-    return pd.Series(
-        list(glob.glob("20_newsgroups/*/*")), name=expects[0][1]
-    ).to_frame()
+    return pd.Series(file_reader.scan("20_newsgroups"), name=expects[0][1]).to_frame()
 
 
-@tada.new_task()
+@tada.new_task(mutates_input=False, row_local=True)
 @tada.requires([pat(r"(.*)\.path")], arg="x")
 @tada.makes([r"{x}.read_file.multiline"])
 @tada.close_task()
 def get_text(x, expects, **kwargs):
     inp = x[x.columns[0]]
-    out = inp.apply(lambda x: open(x, errors="replace").read())
-    out.name = expects[0][1]
+    out = pd.Series(
+        file_reader.read(inp.tolist()), index=inp.index, name=expects[0][1], dtype=object
+    )
     return x.join(out).reset_index(drop=True)
 
 
-@tada.new_task()
+@tada.new_task(mutates_input=False, row_local=True)
 @tada.requires([re.compile(r"(.+)\.multiline")], arg="x")
 @tada.makes([r"{x}.lines"])
 @tada.close_task()
 def get_splits(x, expects, **kwargs):
     inp = x[x.columns[0]]
-    out = inp.astype(str).str.split("\r?\n").explode()
-    out.name = expects[0][1]
-    return x.join(out).reset_index(drop=True)
+    lines = inp.astype(str).str.split("\r?\n")
+    return RaggedFrame.from_lists(x, expects[0][1], lines)
 
 
-@tada.new_task()
+@tada.new_task(mutates_input=False, row_local=True)
 @tada.requires([pat(r"(.+\.lines)")], arg="x")
 @tada.makes([r"{x}.mail_from"])
 @tada.close_task()
 def get_from(x, requires, expects):
     inp = x[x.columns[0]]
-    out = inp.loc[inp.str.startswith("From:")]
+    out = inp.where(inp.str.startswith("From:", na=False))
     out.name = expects[0][1]
     return x.join(out).reset_index(drop=True)
 
 
-@tada.new_task()
+def categorical(values) -> pd.Categorical:
+    "`values` as codes into a vocabulary of their distinct values"
+    codes, vocab = pd.factorize(values)
+    return pd.Categorical.from_codes(codes, vocab)
+
+
+def map_categories(values: pd.Categorical, func) -> pd.Categorical:
+    """`func` applied to each vocabulary entry of `values` rather than each value.
+
+    Entries that `func` maps to the same value are merged, those it maps
+    to NaN become NaN.
+    """
+    if not len(values.categories):
+        return values
+    codes, vocab = pd.factorize(func(pd.Series(values.categories)))
+    old = values.codes
+    new = np.where(old < 0, -1, codes[np.maximum(old, 0)])
+    return pd.Categorical.from_codes(new, vocab)
+
+
+@tada.new_task(mutates_input=False, row_local=True)
 @tada.requires([pat(r"(.+\.lines)")], arg="x")
 @tada.makes(["sample_ind", r"{x}.tokens"], appends=False)
 @tada.close_task()
 def tokenize(x, requires, expects):
     inp = x[x.columns[0]]
-    out = inp.str.split(r"\b").explode().str.lower()
-    out.name = expects[1][1]
-    out = out.reset_index()
-    cols = list(out.columns)
-    cols[0] = "sample_ind"
-    out.columns = cols
+    name = expects[1][1]
+    out = RaggedFrame.from_lists(
+        pd.DataFrame({"sample_ind": inp.index}), name, inp.str.split(r"\b")
+    )
+    # lowercase each distinct token once, the tokens stay codes into it
+    toks = categorical(out.flat[name].to_numpy())
+    out.flat[name] = map_categories(toks, lambda v: v.str.lower())
     return out
 
 
-@tada.new_task()
+@tada.new_task(mutates_input=False, row_local=True)
 @tada.requires(["sample_ind", pat(r"(.+)\.tokens")], arg="x")
 @tada.makes(["sample_ind", r"{x}.clean_tokens"], appends=False)
 @tada.close_task()
 def tokenize_clean(x, requires, expects):
-    toks = x.set_index("sample_ind")[x.columns[1]]
+    toks = x[x.columns[1]]
+    if not isinstance(toks.dtype, pd.CategoricalDtype):
+        toks = toks.astype("category")
+
+    def clean(vocab):
+        vocab = vocab.str.replace(r"\A\W+|\W+\Z", "", regex=True)
+        return vocab.where(vocab.str.len() > 1)
+
+    toks = pd.Series(map_categories(toks.array, clean), index=x.index)
+    keep = toks.notna().to_numpy()
+    return pd.DataFrame(
+        {"sample_ind": x["sample_ind"].to_numpy()[keep], expects[1][1]: toks[keep].array}
+    )
+
+
+def merge_counts(old, new):
+    "Counts of two parts of a column added up, most frequent first"
+    key, count = old.columns
+    both = concat_frames([old, new])
+    out = both.groupby(key, sort=False, observed=True)[count].sum()
+    out = out.sort_values(ascending=False, kind="stable").reset_index()
+    # grouping with sort=False reorders categories by appearance
+    if isinstance(both[key].dtype, pd.CategoricalDtype):
+        out[key] = out[key].cat.reorder_categories(both[key].cat.categories)
+    return out
 
-    toks.update(toks.str.replace(r"\A\W+|\W+\Z", ""))
-    toks = toks.loc[toks.str.len() > 1]
-    toks.name = expects[1][1]
-    return toks.reset_index()
 
+def factorized(values: pd.Series):
+    "Codes of `values` (-1 for NaN) and the distinct values they index"
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    return pd.factorize(values)
 
-@tada.new_task()
+
+@tada.new_task(mutates_input=False, merge=merge_counts)
 @tada.requires([pat(r"(.+)")], arg="x")
 @tada.makes([r"{x}.counts", r"{x}"], appends=False)
 @tada.close_task()
 def counts(x, requires, expects):
-    counts = x[x.columns[0]].value_counts().reset_index()
-    counts.columns = [next(iter(requires.values())), expects[0][1]]
-    return counts
-
-
-@tada.new_task()
+    values = x[x.columns[0]]
+    codes, uniques = factorized(values)
+    hist = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    # most frequent first, ties in order of first appearance
+    order = np.argsort(-hist, kind="stable")
+    order = order[hist[order] > 0]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        keys = pd.Categorical.from_codes(order, dtype=values.dtype)
+    else:
+        keys = uniques.take(order)
+    return pd.DataFrame(
+        {next(iter(requires.values())): keys, expects[0][1]: hist[order]}
+    )
+
+
+@tada.new_task(mutates_input=False)
 @tada.requires([pat(r"(.+\.clean_tokens)\Z")], arg="x")
 @tada.requires([r"{x}", r"{x}.counts"], arg="y")
 @tada.makes([r"{x}.top90"], appends=False)
 @tada.close_task()
 def top90(x, y, requires, expects):
-    col = y[y.columns[1]]
-    sum = col.sum()
-    topwords = col.cumsum() < 0.9 * sum
-    y.loc[topwords, "istop"] = True
-    x = x.join(y.set_index(y.columns[0])["istop"], on=x.columns[0])
-    x = x.loc[x["istop"].fillna(False), x.columns[0]]
-    x.name = expects[0][1]
-    return x.to_frame()
+    count = y[y.columns[1]].to_numpy()
+    return top_rows(x, y[y.columns[0]], count, count.sum(), expects[0][1])
+
+
+def top_rows(x, keys: pd.Series, count: np.ndarray, total: int, name: str):
+    "Rows of x with a value among `keys` before `count` adds up to 90% of `total`"
+    top = np.cumsum(count) < 0.9 * total
+
+    # look up each distinct value of x in the keys, not each row
+    values = x[x.columns[0]]
+    codes, uniques = factorized(values)
+    pos = pd.Index(keys).get_indexer(uniques)
+    top = np.append(top, False)[pos]  # -1, not counted: False
+    mask = top[codes] & (codes >= 0)
+    out = values[mask]
+    out.name = name
+    return out.to_frame()
+
+
+def merge_sketches(old, new):
+    "Sketch of two parts of a column"
+    col = old.columns[0]
+    return pd.DataFrame({col: [old[col].iat[0].merge(new[col].iat[0])]})
+
+
+def sketch_task(epsilon: float = SKETCH_EPSILON):
+    """Register the `sketch` task, making sketches within `epsilon` times
+    the length of a column of its counts, in place of the current one"""
+    SpaceSaving(epsilon)  # check it
+
+    @tada.new_task(mutates_input=False, merge=merge_sketches)
+    @tada.requires([pat(r"(.+)")], arg="x")
+    @tada.makes([r"{x}.sketch"], appends=False)
+    @tada.close_task()
+    def sketch(x, requires, expects):
+        "Space-Saving sketch of x"
+        found = SpaceSaving(epsilon).update(x[x.columns[0]])
+        return pd.DataFrame({expects[0][1]: [found]})
+
+    return sketch
+
+
+sketch = sketch_task()
+
+
+@tada.new_task(mutates_input=False)
+@tada.requires([pat(r"(.+\.clean_tokens)\Z")], arg="x")
+@tada.requires([r"{x}.sketch"], arg="y")
+@tada.makes([r"{x}.top90_approx"], appends=False)
+@tada.close_task()
+def top90_sketch(x, y, requires, expects):
+    found = y[y.columns[0]].iat[0]
+    est = found.frame("key", "count")
+    return top_rows(x, est["key"], est["count"].to_numpy(), found.n, expects[0][1])
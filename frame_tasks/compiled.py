@@ -0,0 +1,205 @@
+"Plans found once and run on many sources"
+
+import concurrent.futures as cf
+import json
+import re
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+
+from .execute import run_actions
+from .solve import Action, find_path
+from .tasks import BaseData, Variable, tasks
+
+COMPILED_PLAN_VERSION = 2
+
+
+def _is_int(x: Any) -> bool:
+    return isinstance(x, int) and not isinstance(x, bool)
+
+
+def _is_columns(x: Any) -> bool:
+    return isinstance(x, list) and all(
+        isinstance(g, list) and all(isinstance(c, str) for c in g) for g in x
+    )
+
+
+def _is_binding(x: Any) -> bool:
+    "(frame, column, argument, resolved name or None, pattern, flags)"
+    return (
+        isinstance(x, list)
+        and len(x) == 6
+        and _is_int(x[0])
+        and isinstance(x[1], str)
+        and isinstance(x[2], str)
+        and (x[3] is None or isinstance(x[3], str))
+        and isinstance(x[4], str)
+        and _is_int(x[5])
+    )
+
+
+def _is_return(x: Any) -> bool:
+    return (
+        isinstance(x, list)
+        and len(x) == 2
+        and (x[0] is None or _is_int(x[0]))
+        and isinstance(x[1], str)
+    )
+
+
+def _is_action(x: Any) -> bool:
+    return (
+        isinstance(x, list)
+        and len(x) == 3
+        and isinstance(x[0], str)
+        and isinstance(x[1], list)
+        and all(map(_is_binding, x[1]))
+        and isinstance(x[2], list)
+        and all(map(_is_return, x[2]))
+    )
+
+
+class CompiledPlan:
+    """The actions `find_path` found for some source columns and goals.
+
+    `run` and `run_many` execute them on sources with those columns
+    without planning again; the argument bindings of each action are
+    worked out on the first run and reused (`Task.bind`). `to_bytes` packs
+    the plan as compressed JSON, e.g. for a celery payload; `from_bytes`
+    checks its shape, and loading it runs no code.
+    """
+
+    def __init__(
+        self,
+        source: List[List[str]],
+        build: List[List[str]],
+        actions: List[Action],
+        goals: List[int],
+        fingerprints: Dict[str, str],
+    ):
+        self.source = source
+        self.build = build
+        self.actions = actions
+        self.goals = goals
+        self.fingerprints = fingerprints
+        # source frame -> columns the plan binds from it
+        self.needs: Dict[int, List[str]] = {}
+        for act in actions:
+            for frame, col in act.CallMap:
+                if frame < len(source) and col not in self.needs.setdefault(frame, []):
+                    self.needs[frame].append(col)
+
+    @staticmethod
+    def compile(
+        source: List[List[str]], build: List[List[str]], **kwargs
+    ) -> "CompiledPlan":
+        "Plan for sources with `source` columns to make `build`; kwargs go to find_path"
+        path = find_path(source, build, **kwargs)
+        if not path:
+            raise RuntimeError("Path not found")
+        final = path[-1][1].Vars
+        goals = [
+            next(i for i, have in enumerate(final) if set(goal) <= have) for goal in build
+        ]
+        actions = [act for act, _ in path if act]
+        fingerprints = {act.Task: tasks[act.Task].fingerprint() for act in actions}
+        return CompiledPlan(source, build, actions, goals, fingerprints)
+
+    def validate(self, sources: List[BaseData]):
+        "Raise ValueError unless the tasks and the columns of `sources` are as planned"
+        for name, fp in self.fingerprints.items():
+            if name not in tasks or tasks[name].fingerprint() != fp:
+                raise ValueError(f"Task {name} changed since the plan was compiled")
+        if len(sources) != len(self.source):
+            raise ValueError(
+                f"Plan takes {len(self.source)} sources, got {len(sources)}"
+            )
+        for frame, cols in self.needs.items():
+            missing = set(cols).difference(sources[frame].columns)
+            if missing:
+                raise ValueError(f"Source {frame} lacks columns {sorted(missing)}")
+
+    def run(self, sources: List[BaseData], **kwargs) -> List[BaseData]:
+        """Frames holding each goal group of the plan, made from `sources`.
+
+        Other frames are dropped as soon as they are no longer needed;
+        kwargs go to `execute.run_actions`.
+        """
+        self.validate(sources)
+        kwargs.setdefault("pool", "serial")
+        data = run_actions(list(sources), self.actions, keep=self.goals, **kwargs)
+        return [data[i] for i in self.goals]  # type: ignore
+
+    def run_many(
+        self, batch: Iterable[List[BaseData]], workers: Optional[int] = None
+    ) -> Iterable[List[BaseData]]:
+        "`run` on each list of sources in `batch`, on `workers` threads, in order"
+        if workers is None:
+            return (self.run(sources) for sources in batch)
+        with cf.ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(self.run, batch))
+
+    def to_bytes(self) -> bytes:
+        actions = [
+            (
+                act.Task,
+                [
+                    (
+                        frame,
+                        col,
+                        arg,
+                        None if var.is_pat else var.string,
+                        var.matcher.pattern,
+                        var.matcher.flags,
+                    )
+                    for (frame, col), (arg, var) in act.CallMap.items()
+                ],
+                [tuple(x) for x in act.Returns],
+            )
+            for act in self.actions
+        ]
+        plan = [
+            COMPILED_PLAN_VERSION,
+            self.source,
+            self.build,
+            actions,
+            self.goals,
+            self.fingerprints,
+        ]
+        return zlib.compress(json.dumps(plan, separators=(",", ":")).encode())
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "CompiledPlan":
+        "Plan packed by `to_bytes`; ValueError for anything else"
+        try:
+            plan = json.loads(zlib.decompress(data).decode())
+        except (zlib.error, UnicodeDecodeError, ValueError) as err:
+            raise ValueError(f"Not a compiled plan: {err}") from None
+        if not isinstance(plan, list) or len(plan) != 6:
+            raise ValueError("Malformed compiled plan")
+        version, source, build, packed, goals, fingerprints = plan
+        if version != COMPILED_PLAN_VERSION:
+            raise ValueError(f"Compiled plan version {version} is not supported")
+        if not (
+            _is_columns(source)
+            and _is_columns(build)
+            and isinstance(packed, list)
+            and all(map(_is_action, packed))
+            and isinstance(goals, list)
+            and all(map(_is_int, goals))
+            and isinstance(fingerprints, dict)
+            and all(isinstance(v, str) for v in fingerprints.values())
+        ):
+            raise ValueError("Malformed compiled plan")
+        actions = []
+        for task, callmap, returns in packed:
+            cm = {}
+            for frame, col, arg, string, pattern, flags in callmap:
+                var = Variable(re.compile(pattern, flags))
+                if string is not None:
+                    # literal, or dynamic requirement resolved to `string`
+                    var = Variable.resolved(var, string)
+                cm[(frame, col)] = (arg, var)
+            actions.append(
+                Action(Task=task, CallMap=cm, Returns=[tuple(x) for x in returns])
+            )
+        return CompiledPlan(source, build, actions, goals, fingerprints)
@@ -3,7 +3,7 @@ import functools
 import re
 import warnings
 from threading import RLock
-from typing import Union, Optional, List
+from typing import Callable, Union, Optional, List
 
 from .tasks import Task, tasks, current_interp_task, Variable, Var_In
 
@@ -74,10 +74,31 @@ def makes(columns: List[str], return_pos: Optional[int] = None, appends=True):
     return __f
 
 
-def new_task(name: Optional[str] = None):
+def new_task(
+    name: Optional[str] = None,
+    mutates_input: bool = True,
+    row_local: bool = False,
+    merge: Optional[Callable] = None,
+    ragged: bool = False,
+):
+    """Start defining a task.
+
+    Argument frames are copies, as the task may modify them in place; a
+    task that never does sets `mutates_input=False` to get frames sharing
+    their column data with earlier results.
+    A `row_local` task makes each output row from one input row alone, so
+    it can run on any split of its input into chunks (see `StreamExecutor`).
+    `merge(old, new)` combines the outputs of the task on two parts of its
+    input into its output on the whole (see `IncrementalRun`).
+    A `ragged` task gets `RaggedFrame` arguments unexploded.
+    """
     updating_task.acquire()
     global current_interp_task
     current_interp_task = Task(name)
+    current_interp_task.mutates_input = mutates_input
+    current_interp_task.row_local = row_local
+    current_interp_task.merge = merge
+    current_interp_task.ragged = ragged
     fset = current_interp_task.set_function
 
     def _f(f):
@@ -0,0 +1,530 @@
+"Run planned actions, independent ones concurrently or row-local ones in chunks"
+
+import concurrent.futures as cf
+import shutil
+import tempfile
+import weakref
+from collections import defaultdict
+from itertools import groupby
+from typing import Callable, DefaultDict, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .ragged import RaggedFrame, concat, explode
+from .result_cache import result_cache
+from .storage import SpilledFrame, frame_nbytes, require_arrow, spill
+from .tasks import BaseData, tasks
+
+POOLS = {"thread": cf.ThreadPoolExecutor, "process": cf.ProcessPoolExecutor}
+
+
+def planned_outputs(action) -> int:
+    "Frames `action` adds to the data, one per position of its Returns"
+    return sum(1 for _ in groupby(action.Returns, key=lambda x: x[0]))
+
+
+class ActionGraph:
+    """Dependencies between the actions of a plan.
+
+    Frame i of the data is either the i-th source or an output of the
+    action that made it; an action depends on the makers of every frame
+    its CallMap reads. Output slots are the ones sequential execution
+    would give each action.
+    """
+
+    def __init__(self, n_sources: int, actions: list):
+        self.actions = actions
+        self.n_sources = n_sources
+        self.slots: List[range] = []
+        # frame index -> action that makes it
+        self.maker: Dict[int, int] = {}
+        pos = n_sources
+        for i, action in enumerate(actions):
+            n = planned_outputs(action)
+            self.slots.append(range(pos, pos + n))
+            for slot in self.slots[-1]:
+                self.maker[slot] = i
+            pos += n
+        self.n_frames = pos
+
+        self.reads: List[Set[int]] = [
+            {frame for frame, _ in action.CallMap} for action in actions
+        ]
+        self.deps: List[Set[int]] = []
+        self.users: List[List[int]] = [[] for _ in actions]
+        for i, reads in enumerate(self.reads):
+            deps = set()
+            for frame in reads:
+                if frame >= self.n_frames or self.maker.get(frame, -1) >= i:
+                    raise ValueError(f"Action {i} reads frame {frame} before it is made")
+                if frame in self.maker:
+                    deps.add(self.maker[frame])
+            self.deps.append(deps)
+            for j in deps:
+                self.users[j].append(i)
+
+
+class Liveness:
+    """Frames no later action reads, to drop as the plan runs.
+
+    A frame is released once every action that reads it has finished,
+    unless it is in `keep` (indices into the data, negative ones from the
+    end). Frames nothing reads are released as soon as they are made.
+    """
+
+    def __init__(self, graph: ActionGraph, keep: Iterable[int]):
+        self.graph = graph
+        self.keep = {k + graph.n_frames if k < 0 else k for k in keep}
+        self.readers: Dict[int, int] = {}
+        for reads in graph.reads:
+            for frame in reads:
+                self.readers[frame] = self.readers.get(frame, 0) + 1
+
+    def unused(self) -> List[int]:
+        "Sources no action reads"
+        return [f for f in range(self.graph.n_sources) if self._dead(f)]
+
+    def done(self, i: int) -> List[int]:
+        "Frames to release once action `i` has finished"
+        out = [f for f in self.graph.slots[i] if self._dead(f)]
+        for frame in self.graph.reads[i]:
+            self.readers[frame] -= 1
+            if self._dead(frame):
+                out.append(frame)
+        return out
+
+    def _dead(self, frame: int) -> bool:
+        return frame not in self.keep and not self.readers.get(frame)
+
+
+class MemoryBudget:
+    """Spills task outputs to disk while those in memory exceed `limit` bytes.
+
+    The frame whose next reader comes last in the plan goes first, so
+    frames only the result needs (mapped back once the plan has run) are
+    spilled before any a pending action reads. Sources belong to the
+    caller and are not counted. Files go to a directory of their own,
+    under `directory` or the temp directory, removed by `close`.
+    """
+
+    def __init__(self, graph: ActionGraph, limit: int, directory: Optional[str] = None):
+        require_arrow()
+        self.graph = graph
+        self.limit = limit
+        self.directory = tempfile.mkdtemp(prefix="frame_tasks.spill.", dir=directory)
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+        self.sizes: Dict[int, int] = {}
+        self.readers: Dict[int, List[int]] = {}
+        for i, reads in enumerate(graph.reads):
+            for frame in reads:
+                self.readers.setdefault(frame, []).append(i)
+        self.started: Set[int] = set()
+        self.spilled = 0
+
+    def close(self):
+        "Remove the spill directory; mapped frames stay readable"
+        self._finalizer()
+
+    def next_use(self, frame: int) -> float:
+        for i in self.readers.get(frame, ()):
+            if i not in self.started:
+                return i
+        return float("inf")
+
+    def add(self, frame: int, data: BaseData):
+        self.sizes[frame] = frame_nbytes(data)
+
+    def drop(self, frame: int):
+        self.sizes.pop(frame, None)
+
+    def enforce(self, data: List[Optional[BaseData]]):
+        total = sum(self.sizes.values())
+        if total <= self.limit:
+            return
+        for frame in sorted(self.sizes, key=self.next_use, reverse=True):
+            if total <= self.limit:
+                break
+            handle = spill(data[frame], self.directory, self.sizes[frame])  # type: ignore
+            if handle is None:
+                continue
+            data[frame] = handle  # type: ignore
+            total -= self.sizes.pop(frame)
+            self.spilled += 1
+
+
+def call_action(
+    task_name: str, callmap, returns, frames: Dict[int, BaseData], cache: bool = False
+):
+    frames = {
+        k: v.load() if isinstance(v, SpilledFrame) else v for k, v in frames.items()
+    }
+    if cache:
+        return result_cache.call(tasks[task_name], callmap, returns, frames)
+    return tasks[task_name].call_task(callmap, returns, frames)  # type: ignore
+
+
+def run_actions(
+    sources: List[BaseData],
+    actions: list,
+    workers: Optional[int] = None,
+    pool: str = "thread",
+    on_done: Optional[Callable[[int], None]] = None,
+    keep: Optional[Iterable[int]] = None,
+    memory_budget: Optional[int] = None,
+    spill_dir: Optional[str] = None,
+    cache_results: bool = False,
+    flat: bool = True,
+) -> List[Optional[BaseData]]:
+    """Run `actions` as soon as the frames they read exist.
+
+    Up to `workers` actions run at once on a "thread" or "process" pool;
+    the "serial" pool runs them one by one in plan order.
+    Each action gets only the frames its CallMap reads; with processes the
+    tasks have to be registered in the workers too (as with the default
+    fork start method). The returned data has every frame where sequential
+    execution would put it. `on_done` is called with each finished action.
+    With `keep`, other frames are set to None once no pending action
+    reads them (see `Liveness`).
+    With `memory_budget` (bytes), outputs are spilled to files under
+    `spill_dir` as needed (see `MemoryBudget`) and mapped back for the
+    actions that read them and for the result. Ragged frames (see
+    `ragged.RaggedFrame`) are exploded once all actions ran, unless
+    `flat` is false.
+    With `cache_results`, outputs come from `result_cache` when a task
+    already ran on the same inputs.
+    """
+    graph = ActionGraph(len(sources), actions)
+    data: List[Optional[BaseData]] = [*sources, *([None] * (graph.n_frames - len(sources)))]
+    waiting = [len(d) for d in graph.deps]
+    live = Liveness(graph, keep) if keep is not None else None
+    if live is not None:
+        for frame in live.unused():
+            data[frame] = None
+    budget = (
+        MemoryBudget(graph, memory_budget, spill_dir)
+        if memory_budget is not None
+        else None
+    )
+
+    def finish(i: int, retn: List[BaseData]):
+        slots = graph.slots[i]
+        if len(retn) != len(slots):
+            raise RuntimeError(
+                f"Task {actions[i].Task} returned {len(retn)} frames,"
+                f" the plan expects {len(slots)}"
+            )
+        for slot, frame in zip(slots, retn):
+            data[slot] = frame
+            if budget is not None:
+                budget.add(slot, frame)
+        if live is not None:
+            for frame in live.done(i):
+                data[frame] = None
+                if budget is not None:
+                    budget.drop(frame)
+        if budget is not None:
+            budget.enforce(data)
+        if on_done is not None:
+            on_done(i)
+
+    def start(i: int) -> Dict[int, BaseData]:
+        if budget is not None:
+            budget.started.add(i)
+        return {frame: data[frame] for frame in graph.reads[i]}  # type: ignore
+
+    def loaded() -> List[Optional[BaseData]]:
+        if budget is not None:
+            for frame, value in enumerate(data):
+                if isinstance(value, SpilledFrame):
+                    data[frame] = value.load()
+            budget.close()
+        if flat:
+            data[:] = map(explode, data)
+        return data
+
+    if pool == "serial":
+        for i, action in enumerate(actions):
+            frames = start(i)
+            retn = call_action(
+                action.Task, action.CallMap, action.Returns, frames, cache_results
+            )
+            del frames
+            finish(i, retn)
+        return loaded()
+
+    try:
+        executor = POOLS[pool](max_workers=workers)
+    except KeyError:
+        raise ValueError(f"Unknown pool {pool}, use one of {['serial', *POOLS]}")
+
+    with executor:
+        running: Dict[cf.Future, int] = {}
+
+        def submit(i: int):
+            action = actions[i]
+            frames = start(i)
+            fut = executor.submit(
+                call_action,
+                action.Task,
+                action.CallMap,
+                action.Returns,
+                frames,
+                cache_results,
+            )
+            running[fut] = i
+
+        for i, n in enumerate(waiting):
+            if not n:
+                submit(i)
+
+        while running:
+            done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+            for fut in done:
+                i = running.pop(fut)
+                finish(i, fut.result())
+                for j in graph.users[i]:
+                    waiting[j] -= 1
+                    if not waiting[j]:
+                        submit(j)
+    return loaded()
+
+
+def shift_index(frame: BaseData, offset: int) -> BaseData:
+    "`frame` numbered from `offset` if its index is a RangeIndex from 0"
+    index = frame.index  # type: ignore
+    if offset and getattr(index, "start", None) == 0 and getattr(index, "step", None) == 1:
+        frame.index = index + offset  # type: ignore
+    return frame
+
+
+class LazyPlan:
+    """Actions of a plan run only when a frame that needs them is asked for.
+
+    `handle(frame)` gives a `FrameHandle`; computing it runs the actions
+    the frame depends on that have not run yet. Frames no pending handle
+    can still need are then dropped, so only the handles hold results.
+    """
+
+    def __init__(self, sources: List[BaseData], actions: list):
+        self.actions = actions
+        self.graph = ActionGraph(len(sources), actions)
+        self.data: List[Optional[BaseData]] = [
+            *sources,
+            *([None] * (self.graph.n_frames - len(sources))),
+        ]
+        self.done: Set[int] = set()
+        self.pending: Set[int] = set()
+        self.runs = 0
+
+    def handle(self, frame: int) -> "FrameHandle":
+        if frame < 0:
+            frame += self.graph.n_frames
+        self.pending.add(frame)
+        return FrameHandle(self, frame)
+
+    def needs(self, frame: int) -> List[int]:
+        "Actions not run yet that `frame` depends on, in plan order"
+        found: Set[int] = set()
+        todo = [frame]
+        while todo:
+            i = self.graph.maker.get(todo.pop())
+            if i is None or i in self.done or i in found:
+                continue
+            found.add(i)
+            todo.extend(self.graph.reads[i])
+        return sorted(found)
+
+    def compute(self, frame: int) -> BaseData:
+        for i in self.needs(frame):
+            action = self.actions[i]
+            frames = {f: self.data[f] for f in self.graph.reads[i]}
+            retn = call_action(action.Task, action.CallMap, action.Returns, frames)
+            del frames
+            if len(retn) != len(self.graph.slots[i]):
+                raise RuntimeError(
+                    f"Task {action.Task} returned {len(retn)} frames,"
+                    f" the plan expects {len(self.graph.slots[i])}"
+                )
+            for slot, out in zip(self.graph.slots[i], retn):
+                self.data[slot] = out
+            self.done.add(i)
+            self.runs += 1
+        out = self.data[frame]
+        self.pending.discard(frame)
+        self.release()
+        return explode(out)
+
+    def release(self):
+        "Drop made frames that no pending handle needs"
+        live = set(self.pending)
+        for frame in self.pending:
+            for i in self.needs(frame):
+                live.update(self.graph.reads[i])
+        for frame in range(self.graph.n_sources, self.graph.n_frames):
+            if frame not in live:
+                self.data[frame] = None
+
+
+class FrameHandle:
+    "A frame of a `LazyPlan`, made on the first call of `compute`"
+
+    def __init__(self, plan: LazyPlan, frame: int):
+        self.plan = plan
+        self.frame = frame
+        self._value: Optional[BaseData] = None
+
+    def compute(self) -> BaseData:
+        if self._value is None:
+            self._value = self.plan.compute(self.frame)
+            self.plan = None  # type: ignore
+        return self._value
+
+    def __repr__(self) -> str:
+        state = "computed" if self._value is not None else "pending"
+        return f"FrameHandle({self.frame}, {state})"
+
+
+def chunks(frame: BaseData, rows: int) -> Iterator[BaseData]:
+    """Consecutive row slices of `frame`, at least one
+
+    A ragged frame is cut between parent rows, so a slice may be longer.
+    """
+    if isinstance(frame, RaggedFrame):
+        yield from frame.chunks(rows)
+        return
+    n = len(frame)  # type: ignore
+    for start in range(0, max(n, 1), rows):
+        yield frame.iloc[start : start + rows]  # type: ignore
+
+
+def stream_actions(
+    sources: List[BaseData],
+    actions: list,
+    chunk_rows: int = 10_000,
+    keep: Optional[Iterable[int]] = None,
+) -> Iterator[Tuple[int, BaseData]]:
+    """Run `actions`, pushing rows through row-local tasks `chunk_rows` at a time.
+
+    An action streams when its task is `row_local`, it reads a single
+    frame and makes a single frame. Starting from a frame in memory, all
+    actions that stream from it, or from what they make, run chunk by
+    chunk. An action whose task has a `merge` function and that reads
+    one such frame runs on each chunk too, its outputs merged as they
+    come. Other actions break the pipeline: the frames they read are
+    gathered in full first. A chunk whose index restarts at 0 is shifted
+    past the rows already made, so the chunks add up to the frame a
+    single call would make.
+
+    Yields (frame index, chunk) for the frames in `keep`, by default the
+    ones no action reads; frames made in full come as a single chunk.
+    Ragged frames stay ragged between tasks and are exploded when yielded.
+    """
+    graph = ActionGraph(len(sources), actions)
+    readers: DefaultDict[int, List[int]] = defaultdict(list)
+    for i, reads in enumerate(graph.reads):
+        for frame in reads:
+            readers[frame].append(i)
+    if keep is None:
+        wanted = {f for f in range(len(sources), graph.n_frames) if not readers[f]}
+    else:
+        wanted = {k + graph.n_frames if k < 0 else k for k in keep}
+    streams = [
+        tasks[act.Task].row_local and len(graph.reads[i]) == 1 and len(graph.slots[i]) == 1
+        for i, act in enumerate(actions)
+    ]
+    folds = [
+        tasks[act.Task].merge is not None
+        and len(graph.reads[i]) == 1
+        and len(graph.slots[i]) == 1
+        for act in actions
+    ]
+
+    live = Liveness(graph, wanted)
+    data: List[Optional[BaseData]] = [*sources, *([None] * (graph.n_frames - len(sources)))]
+    for frame in range(len(sources)):
+        if frame in wanted:
+            yield frame, sources[frame]
+    for frame in live.unused():
+        data[frame] = None
+
+    def check(i: int, retn: List[BaseData]):
+        if len(retn) != len(graph.slots[i]):
+            raise RuntimeError(
+                f"Task {actions[i].Task} returned {len(retn)} frames,"
+                f" the plan expects {len(graph.slots[i])}"
+            )
+
+    done = [False] * len(actions)
+    for i, action in enumerate(actions):
+        if done[i]:
+            continue
+
+        if not streams[i]:
+            frames = {frame: data[frame] for frame in graph.reads[i]}
+            retn = call_action(action.Task, action.CallMap, action.Returns, frames)  # type: ignore
+            del frames
+            check(i, retn)
+            for slot, frame in zip(graph.slots[i], retn):
+                data[slot] = frame
+                if slot in wanted:
+                    yield slot, explode(frame)
+            del retn
+            for frame in live.done(i):
+                data[frame] = None
+            done[i] = True
+            continue
+
+        (root,) = graph.reads[i]
+        pipe: List[int] = []
+        todo = [root]
+        while todo:
+            frame = todo.pop()
+            for j in readers[frame]:
+                if streams[j] and not done[j] and j not in pipe:
+                    pipe.append(j)
+                    todo.append(graph.slots[j][0])
+                elif folds[j] and frame != root and not done[j] and j not in pipe:
+                    pipe.append(j)
+        pipe.sort()
+        made = {graph.slots[j][0] for j in pipe if streams[j]}
+        merged: Dict[int, BaseData] = {}
+        gather: Dict[int, List[BaseData]] = {
+            frame: []
+            for frame in made
+            if any(j not in pipe for j in readers[frame])
+        }
+        offsets: DefaultDict[int, int] = defaultdict(int)
+
+        for chunk in chunks(data[root], chunk_rows):
+            have = {root: chunk}
+            for j in pipe:
+                act = actions[j]
+                (src,) = graph.reads[j]
+                retn = call_action(act.Task, act.CallMap, act.Returns, {src: have[src]})
+                check(j, retn)
+                slot = graph.slots[j][0]
+                if not streams[j]:
+                    merge = tasks[act.Task].merge
+                    found = merged.get(slot)
+                    part = explode(retn[0])
+                    merged[slot] = part if found is None else merge(found, part)  # type: ignore
+                    continue
+                out = shift_index(retn[0], offsets[slot])
+                offsets[slot] += len(out)  # type: ignore
+                have[slot] = out
+                if slot in gather:
+                    gather[slot].append(out)
+                if slot in wanted:
+                    yield slot, explode(out)
+            del have
+
+        for frame, parts in gather.items():
+            data[frame] = concat(parts)
+        del gather
+        for frame, out in merged.items():
+            data[frame] = out
+            if frame in wanted:
+                yield frame, out
+        del merged
+        for j in pipe:
+            done[j] = True
+            for frame in live.done(j):
+                data[frame] = None
@@ -0,0 +1,119 @@
+"Rerun a plan on sources that gained rows, pushing only the new rows through"
+
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .execute import ActionGraph, call_action, run_actions, shift_index
+from .ragged import concat, explode
+from .tasks import BaseData, tasks
+
+
+def prefix_hash(frame: BaseData, rows: int) -> str:
+    "Hash of the columns and the first `rows` rows of `frame`"
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr(list(frame.columns)).encode())
+    head = frame.iloc[:rows]  # type: ignore
+    h.update(pd.util.hash_pandas_object(head, index=True).values.tobytes())
+    return h.hexdigest()
+
+
+class IncrementalRun:
+    """A plan with the data of its last run.
+
+    On a rerun, a source whose earlier rows are unchanged (same prefix
+    hash) only has its new rows pushed through. A `row_local` task reading
+    such a frame runs on the new rows and appends to its last output; a
+    task with a `merge` function runs on the new rows and merges with its
+    last output. Tasks whose inputs did not change keep their output, all
+    others run again on their full inputs. `modes` tells, per action, which
+    of "full", "kept", "appended", "merged" or "rerun" happened. Ragged
+    frames are kept as they are and exploded when returned.
+    """
+
+    def __init__(self, actions: list):
+        self.actions = list(actions)
+        self.data: Optional[List[BaseData]] = None
+        # rows and prefix hash of each source of the last run
+        self.sources: List[Tuple[int, str]] = []
+        self.modes: List[str] = []
+
+    def run(self, sources: List[BaseData]) -> List[BaseData]:
+        if self.data is None or len(sources) != len(self.sources):
+            data = run_actions(list(sources), self.actions, pool="serial", flat=False)
+            self.modes = ["full"] * len(self.actions)
+        else:
+            data = self._update(sources, self.data)
+        self.data = data  # type: ignore
+        self.sources = [(len(x), prefix_hash(x, len(x))) for x in sources]  # type: ignore
+        return list(map(explode, data))  # type: ignore
+
+    def _update(self, sources: List[BaseData], last: List[BaseData]) -> List[BaseData]:
+        graph = ActionGraph(len(sources), self.actions)
+        data = [*sources, *last[len(sources) :]]
+        # frame -> "same", "appended" (with its new rows in `added`) or "changed"
+        state: Dict[int, str] = {}
+        added: Dict[int, BaseData] = {}
+        for f, src in enumerate(sources):
+            rows, digest = self.sources[f]
+            if len(src) < rows or prefix_hash(src, rows) != digest:  # type: ignore
+                state[f] = "changed"
+            elif len(src) == rows:  # type: ignore
+                state[f] = "same"
+            else:
+                state[f] = "appended"
+                added[f] = src.iloc[rows:]  # type: ignore
+
+        self.modes = []
+        for i, action in enumerate(self.actions):
+            task = tasks[action.Task]
+            reads = graph.reads[i]
+            slots = graph.slots[i]
+            states = {state[f] for f in reads}
+
+            if states <= {"same"}:
+                for s in slots:
+                    state[s] = "same"
+                self.modes.append("kept")
+                continue
+
+            if (
+                states == {"appended"}
+                and len(reads) == 1
+                and len(slots) == 1
+                and (task.row_local or task.merge is not None)
+            ):
+                (f,) = reads
+                (s,) = slots
+                retn = call_action(
+                    action.Task, action.CallMap, action.Returns, {f: added[f]}
+                )
+                if len(retn) != 1:
+                    raise RuntimeError(
+                        f"Task {action.Task} returned {len(retn)} frames, the plan expects 1"
+                    )
+                if task.row_local:
+                    part = shift_index(retn[0], len(data[s]))
+                    data[s] = concat([data[s], part])
+                    added[s] = part
+                    state[s] = "appended"
+                    self.modes.append("appended")
+                else:
+                    data[s] = task.merge(explode(data[s]), explode(retn[0]))  # type: ignore
+                    state[s] = "changed"
+                    self.modes.append("merged")
+                continue
+
+            frames = {f: data[f] for f in reads}
+            retn = call_action(action.Task, action.CallMap, action.Returns, frames)
+            if len(retn) != len(slots):
+                raise RuntimeError(
+                    f"Task {action.Task} returned {len(retn)} frames,"
+                    f" the plan expects {len(slots)}"
+                )
+            for s, frame in zip(slots, retn):
+                data[s] = frame
+                state[s] = "changed"
+            self.modes.append("rerun")
+        return data
@@ -0,0 +1,119 @@
+"Read many files at once, for the ingestion tasks"
+
+import concurrent.futures as cf
+import locale
+import mmap
+import os
+import time
+from typing import Iterable, List, NamedTuple, Optional
+
+MMAP_MIN_BYTES = 1 << 20
+READ_BATCH = 64
+
+IngestStats = NamedTuple(
+    "IngestStats", [("files", int), ("bytes", int), ("seconds", float)]
+)
+
+
+class FileReader:
+    """Directory scans and file reads spread over a thread pool.
+
+    Files are read in batches per thread, each with one `read` of its
+    whole size, or mapped when larger than `mmap_min_bytes`; text is
+    decoded like `open(path, errors=...).read()`, universal newlines
+    included. Results keep the order of the paths given. `stats` adds up
+    the files, bytes and time spent reading.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        mmap_min_bytes: int = MMAP_MIN_BYTES,
+        batch: int = READ_BATCH,
+    ):
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.mmap_min_bytes = mmap_min_bytes
+        self.batch = batch
+        self.stats = IngestStats(0, 0, 0.0)
+
+    def scan(self, root: str, depth: int = 2) -> List[str]:
+        """Paths `depth` levels below `root`, as `glob(root + "/*" * depth)` finds them.
+
+        Names starting with a dot are skipped, like glob does; each
+        directory of the last level is listed on its own thread.
+        """
+        dirs = [root]
+        with cf.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for level in range(depth):
+                last = level == depth - 1
+                found = pool.map(lambda d: _list_dir(d, dirs_only=not last), dirs)
+                dirs = [path for paths in found for path in paths]
+        return dirs
+
+    def read(self, paths: Iterable[str], errors: str = "replace") -> List[str]:
+        "Text of each file in `paths`, in order"
+        paths = list(paths)
+        encoding = locale.getpreferredencoding(False)
+        start = time.perf_counter()
+        batches = [paths[i : i + self.batch] for i in range(0, len(paths), self.batch)]
+
+        def read_batch(batch: List[str]):
+            return [self._read_one(p, encoding, errors) for p in batch]
+
+        with cf.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            done = list(pool.map(read_batch, batches))
+        texts = [text for texts in done for text, _ in texts]
+        nbytes = sum(n for texts in done for _, n in texts)
+        self.stats = IngestStats(
+            self.stats.files + len(paths),
+            self.stats.bytes + nbytes,
+            self.stats.seconds + time.perf_counter() - start,
+        )
+        return texts
+
+    def _read_one(self, path: str, encoding: str, errors: str):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            if size >= self.mmap_min_bytes:
+                with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as m:
+                    text = str(m, encoding, errors)
+            else:
+                chunks = []
+                while True:
+                    data = os.read(fd, max(size, 1 << 16))
+                    if not data:
+                        break
+                    chunks.append(data)
+                text = str(b"".join(chunks), encoding, errors)
+        finally:
+            os.close(fd)
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text, size
+
+    def report(self) -> str:
+        files, nbytes, seconds = self.stats
+        seconds = seconds or float("nan")
+        return (
+            f"{files} files, {nbytes / 1e6:.1f} MB in {seconds:.2f}s:"
+            f" {files / seconds:.0f} files/s, {nbytes / 1e6 / seconds:.1f} MB/s"
+        )
+
+
+def _list_dir(path: str, dirs_only: bool) -> List[str]:
+    out = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                if dirs_only and not entry.is_dir():
+                    continue
+                out.append(os.path.join(path, entry.name))
+    except OSError:
+        pass
+    return out
+
+
+file_reader = FileReader()
@@ -0,0 +1,100 @@
+"Persistent cache of paths found by find_path"
+
+import hashlib
+import os
+import pathlib
+import pickle as pk
+import tempfile
+from typing import List, Optional, Union
+
+from .tasks import task_index
+
+PLAN_CACHE_ENV = "FRAME_TASKS_PLAN_CACHE"
+
+
+def cache_directory(name: str) -> pathlib.Path:
+    "Directory `name` of this package under $XDG_CACHE_HOME or ~/.cache"
+    base = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(base) / "frame_tasks" / name
+
+
+def private_directory(directory: pathlib.Path, create: bool = False) -> bool:
+    """Whether `directory` belongs to the current user and no one else can write to it.
+
+    Cached files are only loaded from, and written to, such a directory.
+    With `create`, a missing one is made readable by the user alone.
+    """
+    try:
+        if create:
+            directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        st = directory.stat()
+    except OSError:
+        return False
+    if not hasattr(os, "getuid"):  # pragma: no cover
+        return True
+    return st.st_uid == os.getuid() and not st.st_mode & 0o022
+
+
+class PlanCache:
+    """Paths found by `find_path`, pickled to one file per key.
+
+    The key covers the source columns, the goal columns, the search
+    settings and the fingerprint of every registered task, so a changed
+    task definition never reuses a stale plan. Plans are only unpickled
+    from a directory of the current user that others cannot write to (see
+    `private_directory`).
+    """
+
+    def __init__(self, directory: Optional[Union[str, pathlib.Path]] = None):
+        if directory is None:
+            directory = os.environ.get(PLAN_CACHE_ENV) or cache_directory("plans")
+        self.directory = pathlib.Path(directory)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(source: List[List[str]], dest: List[List[str]], *settings) -> str:
+        h = hashlib.blake2b(digest_size=20)
+        h.update(task_index.fingerprint().encode())
+        h.update(repr([sorted(x) for x in source]).encode())
+        h.update(repr([sorted(x) for x in dest]).encode())
+        h.update(repr(settings).encode())
+        return h.hexdigest()
+
+    def path(self, key: str) -> pathlib.Path:
+        return self.directory / f"{key}.pkl"
+
+    def get(self, key: str) -> Optional[list]:
+        if not private_directory(self.directory):
+            self.misses += 1
+            return None
+        try:
+            with open(self.path(key), "rb") as f:
+                plan = pk.load(f)
+        except (OSError, EOFError, pk.UnpicklingError, AttributeError, ImportError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return plan
+
+    def put(self, key: str, plan: list):
+        if not private_directory(self.directory, create=True):
+            return
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pk.dump(list(plan), f)
+            os.replace(tmp, self.path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def clear(self):
+        for x in self.directory.glob("*.pkl"):
+            x.unlink()
+
+
+plan_cache = PlanCache()
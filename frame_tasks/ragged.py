@@ -0,0 +1,250 @@
+"Frames with nested values, kept unexploded between tasks"
+
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class RaggedFrame:
+    """The frame `explode` would make, stored without repeating the parent rows.
+
+    Row i of `parent` owns rows `offsets[i]:offsets[i + 1]` of `flat`, at
+    least one (an empty list explodes to a single NaN). The columns of
+    `flat` hold the nested values, one row each; the columns of `parent`
+    are only repeated when asked for. `columns` is the order of the
+    columns in the exploded frame, whose index is a RangeIndex from
+    `start`.
+
+    `Task.call_task` hands a task only the columns it requires: the flat
+    ones as they are, parent ones repeated. Tasks made with
+    `new_task(ragged=True)` get the RaggedFrame itself. Executors explode
+    the frames they return.
+    """
+
+    def __init__(
+        self,
+        parent: pd.DataFrame,
+        flat: pd.DataFrame,
+        offsets: np.ndarray,
+        columns: Optional[List[str]] = None,
+        start: int = 0,
+    ):
+        if len(offsets) != len(parent) + 1 or offsets[-1] != len(flat):
+            raise ValueError(
+                f"Offsets for {len(parent)} parent and {len(flat)} flat rows"
+                f" end at {offsets[-1]} after {len(offsets) - 1} rows"
+            )
+        self.parent = parent
+        self.flat = flat
+        self.offsets = offsets
+        self.order = list(columns or [*parent.columns, *flat.columns])
+        self.start = start
+
+    @staticmethod
+    def from_lists(parent: pd.DataFrame, name: str, lists: pd.Series) -> "RaggedFrame":
+        "`parent` with the values of `lists`, one list per parent row, as column `name`"
+        values = lists.explode()
+        sizes = lists.str.len().fillna(0).clip(lower=1).to_numpy(dtype=np.int64)
+        offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        flat = pd.DataFrame({name: values.to_numpy()})
+        return RaggedFrame(parent, flat, offsets)
+
+    @property
+    def columns(self) -> pd.Index:
+        return pd.Index(self.order)
+
+    @property
+    def index(self) -> pd.RangeIndex:
+        return pd.RangeIndex(self.start, self.start + len(self.flat))
+
+    @index.setter
+    def index(self, index: pd.Index):
+        if (
+            not isinstance(index, pd.RangeIndex)
+            or index.step != 1
+            or len(index) != len(self.flat)
+        ):
+            raise ValueError("A RaggedFrame is indexed by a RangeIndex over its rows")
+        self.start = index.start
+
+    @property
+    def empty(self) -> bool:
+        return not len(self.flat) or not self.order
+
+    def __len__(self) -> int:
+        return len(self.flat)
+
+    def parent_rows(self) -> np.ndarray:
+        "Position in `parent` of each flat row"
+        return np.repeat(np.arange(len(self.parent)), np.diff(self.offsets))
+
+    def __getitem__(self, col: str) -> pd.Series:
+        if col in self.flat.columns:
+            out = self.flat[col]
+        else:
+            out = self._repeat(col, self.parent_rows())
+        if self.start:
+            out = out.set_axis(self.index)
+        return out
+
+    def _repeat(self, col: str, rows: np.ndarray) -> pd.Series:
+        values = self.parent[col]
+        if isinstance(values.dtype, np.dtype):
+            return pd.Series(values.to_numpy()[rows], name=col)
+        return pd.Series(values.array.take(rows), name=col)
+
+    def project(self, columns: List[str], ragged: bool = False):
+        """Exploded frame of `columns`, a RaggedFrame of them with `ragged`.
+
+        Flat columns are not copied, each parent column is repeated once.
+        """
+        if ragged:
+            return RaggedFrame(
+                self.parent[[c for c in self.parent.columns if c in columns]],
+                self.flat[[c for c in self.flat.columns if c in columns]],
+                self.offsets,
+                [c for c in columns if c in self.order],
+                self.start,
+            )
+        rows = None
+        out: Dict[str, pd.Series] = {}
+        for col in columns:
+            if col in self.flat.columns:
+                out[col] = self.flat[col]
+                continue
+            if rows is None:
+                rows = self.parent_rows()
+            out[col] = self._repeat(col, rows)
+        frame = pd.DataFrame(out, copy=False)
+        if self.start:
+            frame.index = self.index
+        return frame
+
+    def explode(self) -> pd.DataFrame:
+        return self.project(self.order)
+
+    def with_flat(self, flat: pd.DataFrame) -> "RaggedFrame":
+        """`flat`, a frame with the rows of this one, and the columns it lacks.
+
+        Those follow the columns of `flat`, as `append_columns` adds them
+        to an exploded frame; only the nested ones are copied over.
+        """
+        have = set(flat.columns)
+        extra = self.flat[[c for c in self.flat.columns if c not in have]]
+        parent = self.parent[[c for c in self.parent.columns if c not in have]]
+        order = [*flat.columns, *(c for c in self.order if c not in have)]
+        flat = pd.concat([flat.reset_index(drop=True), extra], axis=1, copy=False)
+        return RaggedFrame(parent, flat, self.offsets, order, self.start)
+
+    def copy(self) -> "RaggedFrame":
+        "A RaggedFrame with its own copies of the parent and flat frames"
+        return RaggedFrame(
+            self.parent.copy(),
+            self.flat.copy(),
+            self.offsets.copy(),
+            self.order,
+            self.start,
+        )
+
+    def take_parents(self, start: int, stop: int) -> "RaggedFrame":
+        "Parent rows `start:stop` with their nested values, keeping their index"
+        first, last = self.offsets[start], self.offsets[stop]
+        return RaggedFrame(
+            self.parent.iloc[start:stop],
+            self.flat.iloc[first:last].reset_index(drop=True),
+            self.offsets[start : stop + 1] - first,
+            self.order,
+            self.start + first,
+        )
+
+    def chunks(self, rows: int) -> Iterator["RaggedFrame"]:
+        "Consecutive slices of about `rows` rows that keep parent rows whole, at least one"
+        start = 0
+        n = len(self.parent)
+        while True:
+            stop = int(np.searchsorted(self.offsets, self.offsets[start] + rows, "right"))
+            stop = min(max(stop - 1, start + 1), n)
+            yield self.take_parents(start, stop)
+            if stop >= n:
+                break
+            start = stop
+
+    # the rest of `tasks.BaseData`, on the exploded frame
+    def reindex(self, *args, **kwargs) -> pd.DataFrame:
+        return self.explode().reindex(*args, **kwargs)
+
+    def drop_duplicates(self, *args, **kwargs) -> pd.DataFrame:
+        return self.explode().drop_duplicates(*args, **kwargs)
+
+    def join(self, *args, **kwargs) -> pd.DataFrame:
+        return self.explode().join(*args, **kwargs)
+
+    def set_index(self, *args, **kwargs) -> pd.DataFrame:
+        return self.explode().set_index(*args, **kwargs)
+
+    def memory_usage(self, index: bool = True, deep: bool = False) -> pd.Series:
+        return pd.concat(
+            [
+                self.parent.memory_usage(index=index, deep=deep),
+                self.flat.memory_usage(index=False, deep=deep),
+                pd.Series({"offsets": self.offsets.nbytes}),
+            ]
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"RaggedFrame({len(self.parent)} parent rows, {len(self)} rows from {self.start},"
+            f" columns {self.order})"
+        )
+
+
+def explode(frame):
+    "`frame` as a plain frame, exploded if ragged"
+    if isinstance(frame, RaggedFrame):
+        return frame.explode()
+    return frame
+
+
+def concat_frames(frames: List[pd.DataFrame], **kwargs) -> pd.DataFrame:
+    """`pd.concat` of `frames`, keeping categorical columns categorical.
+
+    pandas makes a column whose parts have different categories an object
+    column; here the categories are unioned, in order of appearance.
+    """
+    out = pd.concat(frames, **kwargs)
+    if len(frames) < 2 or not out.columns.is_unique:
+        return out
+    for col in out.columns:
+        parts = [x[col] for x in frames if col in x.columns]
+        if (
+            len(parts) == len(frames)
+            and all(isinstance(x.dtype, pd.CategoricalDtype) for x in parts)
+            and not isinstance(out[col].dtype, pd.CategoricalDtype)
+        ):
+            out[col] = pd.api.types.union_categoricals([x.array for x in parts])
+    return out
+
+
+def concat(frames: List):
+    """Rows of `frames` one after another.
+
+    Ragged frames with the same columns stay ragged, numbered from the
+    first; anything else is exploded and joined by `concat_frames`.
+    """
+    if all(isinstance(x, RaggedFrame) for x in frames) and all(
+        x.order == frames[0].order for x in frames
+    ):
+        ends = np.cumsum([0, *(len(x) for x in frames[:-1])])
+        offsets = np.concatenate(
+            [[0], *(x.offsets[1:] + end for x, end in zip(frames, ends))]
+        )
+        return RaggedFrame(
+            concat_frames([x.parent for x in frames]),
+            concat_frames([x.flat for x in frames], ignore_index=True),
+            offsets,
+            frames[0].order,
+            frames[0].start,
+        )
+    return concat_frames([explode(x) for x in frames])
@@ -0,0 +1,168 @@
+"Persistent cache of task results, addressed by the task and its inputs"
+
+import hashlib
+import os
+import pathlib
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from . import storage
+from .plan_cache import cache_directory, private_directory
+from .ragged import RaggedFrame
+from .tasks import BaseData, CallReqsMap, RetArg, Task
+
+RESULT_CACHE_ENV = "FRAME_TASKS_RESULT_CACHE"
+RESULT_CACHE_BYTES = 2 << 30
+
+
+class ResultCache:
+    """Outputs of `Task.call_task`, one directory of Feather files per call.
+
+    The key covers the task fingerprint, the bound columns and the
+    requirements they meet, the expected outputs and a hash of the
+    content of every bound frame (all of it, as appending tasks pass the
+    other columns through). A changed task or changed input data misses,
+    so a rerun recomputes only what depends on a change. Entries over
+    `max_bytes` in total are evicted least recently used first. Calls with
+    inputs that cannot be hashed, or outputs Arrow cannot store, are not
+    cached. As with plans, only a directory of the current user that
+    others cannot write to is used.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Union[str, pathlib.Path]] = None,
+        max_bytes: int = RESULT_CACHE_BYTES,
+    ):
+        if directory is None:
+            directory = os.environ.get(RESULT_CACHE_ENV) or cache_directory("results")
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def frame_hash(frame: BaseData) -> Optional[str]:
+        """Hash of the columns, dtypes, index and values of `frame`
+
+        Of a `RaggedFrame`, those of its parent and flat frames and its
+        offsets. Computed on every call: a frame may have changed in place
+        since.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        parts = [frame]
+        if isinstance(frame, RaggedFrame):
+            h.update(repr((frame.order, frame.start)).encode())
+            h.update(np.asarray(frame.offsets, dtype=np.int64).tobytes())
+            parts = [frame.parent, frame.flat]
+        try:
+            for part in parts:
+                h.update(repr(list(zip(part.columns, part.dtypes))).encode())  # type: ignore
+                h.update(pd.util.hash_pandas_object(part, index=True).values.tobytes())
+        except (TypeError, ValueError, AttributeError):
+            return None
+        return h.hexdigest()
+
+    def key(
+        self, task: Task, req_map: CallReqsMap, expects: List[RetArg], data
+    ) -> Optional[str]:
+        h = hashlib.blake2b(digest_size=20)
+        h.update(task.fingerprint().encode())
+        h.update(repr(expects).encode())
+        frames: Dict[int, str] = {}
+        for (data_i, data_col), (arg, var) in req_map.items():
+            if data_i not in frames:
+                digest = self.frame_hash(data[data_i])
+                if digest is None:
+                    return None
+                frames[data_i] = digest
+            h.update(f"{arg}:{var!r}:{data_col}:{frames[data_i]}".encode())
+        return h.hexdigest()
+
+    def path(self, key: str) -> pathlib.Path:
+        return self.directory / key
+
+    def get(self, key: str) -> Optional[List[BaseData]]:
+        entry = self.path(key)
+        if not private_directory(self.directory):
+            self.misses += 1
+            return None
+        try:
+            files = sorted(entry.glob("*.feather"), key=lambda x: int(x.stem))
+            if not files:
+                raise FileNotFoundError(entry)
+            frames = [storage.read_frame(str(x)) for x in files]
+            os.utime(entry)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return frames
+
+    def put(self, key: str, frames: List[BaseData]):
+        if not private_directory(self.directory, create=True):
+            return
+        try:
+            tmp = tempfile.mkdtemp(dir=self.directory, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            for i, frame in enumerate(frames):
+                if not storage.write_frame(frame, os.path.join(tmp, f"{i}.feather")):
+                    return
+            os.rename(tmp, self.path(key))
+        except OSError:
+            pass
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        "Remove the least recently used entries beyond `max_bytes`"
+        if not private_directory(self.directory):
+            return
+        entries = []
+        total = 0
+        for entry in self.directory.iterdir():
+            if entry.suffix == ".tmp":
+                continue
+            try:
+                size = sum(x.stat().st_size for x in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except OSError:
+                continue
+            total += size
+        for _mtime, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def call(
+        self, task: Task, req_map: CallReqsMap, expects: List[RetArg], data
+    ) -> List[BaseData]:
+        "`task.call_task`, or its stored result for the same inputs"
+        if storage.pa is None:
+            return task.call_task(req_map, expects, data)
+        key = self.key(task, req_map, expects, data)
+        if key is None:
+            self.misses += 1
+            return task.call_task(req_map, expects, data)
+        found = self.get(key)
+        if found is not None:
+            return found
+        out = task.call_task(req_map, expects, data)
+        self.put(key, out)
+        return out
+
+    def clear(self):
+        if self.directory.exists():
+            for entry in self.directory.iterdir():
+                shutil.rmtree(entry, ignore_errors=True)
+
+
+result_cache = ResultCache()
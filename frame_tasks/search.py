@@ -0,0 +1,355 @@
+"Informed search for task paths"
+
+import heapq
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+try:
+    from re import _parser as sre_parse  # type: ignore
+except ImportError:  # pragma: no cover
+    import sre_parse  # type: ignore
+
+from .tasks import NameTemplate, Task, Variable, is_dynamic, tasks
+
+MAX_GOAL_NAMES = 4096
+INF = float("inf")
+
+# A column some task needs: when `open`, any column whose `matcher` group
+# `group` equals `value` will do, otherwise only `name`.
+Requirement = NamedTuple(
+    "Requirement",
+    [
+        ("name", str),
+        ("matcher", Optional[re.Pattern]),
+        ("group", int),
+        ("value", str),
+        ("open", bool),
+    ],
+)
+
+
+def template_matcher(template: str) -> Tuple[re.Pattern, List[Tuple[str, int, int]]]:
+    "Regex matching every name `template` can make, and its placeholders in group order"
+    compiled = NameTemplate.compile(template)
+    return compiled.inverse, compiled.keys
+
+
+def requirement_order(task: Task) -> List[Tuple[str, Variable]]:
+    "Requirements of `task` in the order `TaskCaller` puts them in a CallReqsMap"
+    dynamic = set()
+    for arg, var in task.requires:
+        if not var.is_pat and is_dynamic(var.string):
+            dynamic.add(arg)
+    return list(reversed(sorted(task.requires, key=lambda x: x[0] not in dynamic)))
+
+
+def pattern_name(matcher: re.Pattern, group: int, value: str) -> Optional[Requirement]:
+    """Shortest column matched by `matcher` whose `group` is `value`
+
+    Only patterns made of literals around the group are inverted."""
+    name = []
+    try:
+        parsed = sre_parse.parse(matcher.pattern, matcher.flags)
+    except re.error:
+        return None
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            name.append(chr(av))
+        elif op is sre_parse.SUBPATTERN and av[0] == group + 1:
+            name.append(value)
+        elif op is sre_parse.AT and av in (
+            sre_parse.AT_BEGINNING,
+            sre_parse.AT_BEGINNING_STRING,
+            sre_parse.AT_END,
+            sre_parse.AT_END_STRING,
+        ):
+            pass
+        else:
+            return None
+    name_ = "".join(name)
+    m = matcher.match(name_)
+    if m is None or m.groups()[group] != value:
+        return None
+    probe = matcher.match(name_ + "\x01")
+    is_open = probe is not None and probe.groups()[group] == value
+    return Requirement(name_, matcher, group, value, is_open)
+
+
+def regress(task: Task, name: str) -> List[Optional[List[Requirement]]]:
+    """Ways `task` can make column `name`, each with the columns it needs
+
+    None stands for requirements that could not be worked out."""
+    found: List[Optional[List[Requirement]]] = []
+    order = requirement_order(task)
+    for _posn, template in task.generates:
+        matcher, keys = template_matcher(template)
+        m = matcher.match(name)
+        if m is None:
+            continue
+        if len(keys) > 1:
+            # several placeholders may split `name` more than one way
+            found.append(None)
+            continue
+        found.append(_requirements(order, dict(zip(keys, m.groups()))))
+    return found
+
+
+def _requirements(
+    order: List[Tuple[str, Variable]], binding: Dict[Tuple[str, int, int], str]
+) -> Optional[List[Requirement]]:
+    reqs = []
+    for arg, var in order:
+        if not var.is_pat:
+            if not is_dynamic(var.string):
+                reqs.append(Requirement(var.string, None, 0, var.string, False))
+                continue
+            template = NameTemplate.compile(var.string)
+            try:
+                values = [binding[ref] for ref in template.refs]
+            except KeyError:
+                return None
+            name = template.literals[0] + "".join(
+                v + lit for v, lit in zip(values, template.literals[1:])
+            )
+            reqs.append(Requirement(name, None, 0, name, False))
+            continue
+
+        arg_reqs = [v for a, v in order if a == arg]
+        refers = [
+            (match_ind, value)
+            for (a, var_ind, match_ind), value in binding.items()
+            if a == arg and var_ind < len(arg_reqs) and arg_reqs[var_ind] is var
+        ]
+        if len(refers) != 1:
+            return None
+        match_ind, value = refers[0]
+        req = pattern_name(var.matcher, match_ind, value)
+        if req is None:
+            return None
+        reqs.append(req)
+    return reqs
+
+
+class GoalGraph:
+    """Backward analysis of the task registry from the goal columns.
+
+    Goal names are matched against every `makes` template; each match
+    names the columns its task would need, which are analysed in turn.
+    `cost` gives the h_max estimate of how many more tasks a state needs.
+    The estimate never exceeds the true distance when the templates that
+    build a column from a requirement extend the bound name (`{x}.lines`),
+    as all tasks here do.
+    """
+
+    def __init__(self, goal: List[List[str]], max_names: int = MAX_GOAL_NAMES):
+        self.goal = sorted({x for g in goal for x in g})
+        # name -> [(task name, columns it needs or None), ...]
+        self.producers: Dict[str, List[Tuple[str, Optional[List[Requirement]]]]] = {}
+        self.complete = True
+
+        frontier = deque(self.goal)
+        while frontier:
+            name = frontier.popleft()
+            if name in self.producers:
+                continue
+            if len(self.producers) >= max_names:
+                self.complete = False
+                break
+            prods = self.producers[name] = []
+            for key, task in tasks.items():
+                for reqs in regress(task, name):
+                    prods.append((key, reqs))
+                    for req in reqs or ():
+                        if req.name not in self.producers:
+                            frontier.append(req.name)
+
+        # names of the graph that also satisfy an open requirement
+        self.alias: Dict[Requirement, List[str]] = {}
+        for prods in self.producers.values():
+            for _key, reqs in prods:
+                for req in reqs or ():
+                    if req.open and req not in self.alias:
+                        self.alias[req] = [
+                            x for x in self.producers if self.satisfies(req, x)
+                        ] or [req.name]
+        self.memo: "OrderedDict[FrozenSet[str], float]" = OrderedDict()
+        self.relevant = self._relevant()
+
+    def _relevant(self) -> Optional[FrozenSet[str]]:
+        """Columns on some path to the goal, or None when that is not known
+
+        A column a task makes without binding it to the task's inputs (like
+        `sample_ind` of `tokenize`) is taken to be wanted only alongside the
+        task's other outputs, so the task has to make some other column of
+        the graph from known inputs.
+        """
+        if not self.complete:
+            return None
+        bound = {
+            key
+            for prods in self.producers.values()
+            for key, reqs in prods
+            if reqs is not None
+        }
+        for prods in self.producers.values():
+            for key, reqs in prods:
+                if reqs is None and key not in bound:
+                    return None
+        return frozenset(self.producers)
+
+    def is_relevant(self, action) -> bool:
+        """Whether `action` makes a new column on some path to the goal
+
+        That is a column of the graph, or one satisfying an open requirement
+        of it, which need not be in the graph.
+        """
+        if self.relevant is None:
+            return True
+        made = action.Returns[: len(tasks[action.Task].generates)]
+        used = {col for _, col in action.CallMap}
+        return any(
+            col not in used
+            and (
+                col in self.relevant
+                or any(self.satisfies(req, col) for req in self.alias)
+            )
+            for _, col in made
+        )
+
+    @staticmethod
+    def satisfies(req: Requirement, name: str) -> bool:
+        if name == req.name:
+            return True
+        if not req.open:
+            return False
+        m = req.matcher.match(name)  # type: ignore
+        return m is not None and m.groups()[req.group] == req.value
+
+    def cost(self, have: FrozenSet[str]) -> float:
+        "Lower bound on the tasks needed before all goal columns exist"
+        try:
+            return self.memo[have]
+        except KeyError:
+            pass
+
+        cost: Dict[str, float] = {}
+        for name in self.producers:
+            cost[name] = 0 if name in have else INF
+        have_open: Dict[Requirement, bool] = {
+            req: any(self.satisfies(req, x) for x in have) for req in self.alias
+        }
+
+        # open requirements no alias of the graph can meet: a column outside
+        # the graph may still do (`{x}.path.local` for `(.*)\.path`)
+        loose: Set[Requirement] = set()
+
+        def alias_cost(req: Requirement) -> float:
+            return min(cost.get(x, 1) for x in self.alias[req])
+
+        def req_cost(req: Requirement) -> float:
+            if req.open:
+                if have_open[req]:
+                    return 0
+                return 1 if req in loose else alias_cost(req)
+            return cost.get(req.name, 0 if req.name in have else 1)
+
+        changed = True
+        while changed:
+            changed = False
+            for name, prods in self.producers.items():
+                if cost[name] == 0:
+                    continue
+                for _key, reqs in prods:
+                    c = 1 + max(map(req_cost, reqs or ()), default=0)
+                    if c < cost[name]:
+                        cost[name] = c
+                        changed = True
+            if not changed:
+                stuck = {
+                    req
+                    for req in self.alias
+                    if req not in loose and not have_open[req] and alias_cost(req) == INF
+                }
+                loose |= stuck
+                changed = bool(stuck)
+
+        out = max(
+            (cost.get(x, 0 if x in have else 1) for x in self.goal), default=0
+        )
+        self.memo[have] = out
+        if len(self.memo) > MAX_GOAL_NAMES:
+            self.memo.popitem(last=False)
+        return out
+
+
+def state_key(state) -> tuple:
+    "BitStates with the same frames in any order and the same blocked tasks are equivalent"
+    from .solve import ignored_tasks
+
+    return ignored_tasks(state), tuple(sorted(state.Vars))
+
+
+def astar(problem, graph_search: bool = True):
+    """A* search over `BitState`/`Action` tuples of a `TaskProblem`
+
+    Returns the path as [(action, state), ...] starting with (None, initial),
+    like simpleai's `SearchNode.path`, or None.
+    """
+    initial = problem.initial_state
+    h0 = problem.heuristic(initial)
+    if h0 == INF:
+        return None
+
+    # node: (state, parent node id, action, depth)
+    nodes: List[tuple] = [(initial, -1, None, 0)]
+    heap = [(h0, 0, 0)]
+    closed = set()
+
+    while heap:
+        _f, _neg_depth, node_id = heapq.heappop(heap)
+        state, _parent, _action, depth = nodes[node_id]
+        if problem.is_goal(state):
+            path = []
+            while node_id >= 0:
+                state, node_id, action, _ = nodes[node_id]
+                path.append((action, state))
+            return path[::-1]
+        if graph_search:
+            key = state_key(state)
+            if key in closed:
+                continue
+            closed.add(key)
+
+        for action in problem.actions(state):
+            state2 = problem.result(state, action)
+            h = problem.heuristic(state2)
+            if h == INF:
+                continue
+            nodes.append((state2, node_id, action, depth + 1))
+            heapq.heappush(heap, (depth + 1 + h, -(depth + 1), len(nodes) - 1))
+    return None
+
+
+def benchmark(
+    source: List[List[str]],
+    dest: List[List[str]],
+    methods=("breadth_first", "astar"),
+    prune: bool = True,
+) -> Dict[str, Dict[str, float]]:
+    "Nodes expanded, seconds taken and path length of each search method"
+    from .solve import TaskProblem, action_cache, run_search
+
+    out = {}
+    for method in methods:
+        action_cache.clear()
+        problem = TaskProblem(goal=dest, initial_vars=source, prune=prune)
+        start = time.perf_counter()
+        path = run_search(problem, method=method)
+        out[method] = {
+            "expanded": problem.expanded,
+            "seconds": time.perf_counter() - start,
+            "length": max(len(path) - 1, 0),
+        }
+    return out
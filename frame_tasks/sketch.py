@@ -0,0 +1,108 @@
+"Bounded memory frequency estimates that merge across chunks and partitions"
+
+import math
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+SKETCH_EPSILON = 1e-4
+
+
+class SpaceSaving:
+    """Space-Saving summary of the most frequent values of a column.
+
+    At most `capacity` = ceil(1 / epsilon) values are monitored, each with
+    an estimated count that overestimates its true count by at most
+    `error` <= epsilon * n, n being the number of values seen. Values not
+    monitored occur at most `floor` times. Every value occurring more than
+    epsilon * n times is monitored.
+
+    `update` adds a chunk of values, `merge` combines the summaries of two
+    parts of a column (the parallel Space-Saving merge), keeping the same
+    bound for the whole column.
+    """
+
+    def __init__(self, epsilon: float = SKETCH_EPSILON):
+        if not 0 < epsilon < 1:
+            raise ValueError(f"epsilon must be in (0, 1), got {epsilon}")
+        self.epsilon = epsilon
+        self.capacity = math.ceil(1 / epsilon)
+        self.n = 0
+        self.floor = 0
+        # value -> (estimated count, error)
+        self.counters: Dict[Hashable, Tuple[int, int]] = {}
+
+    @staticmethod
+    def from_counts(
+        counts: Dict[Hashable, int], epsilon: float = SKETCH_EPSILON
+    ) -> "SpaceSaving":
+        "Summary of exact `counts`, keeping the `capacity` largest"
+        out = SpaceSaving(epsilon)
+        out.n = int(sum(counts.values()))
+        top = sorted(counts.items(), key=lambda x: -x[1])
+        out.counters = {k: (int(c), 0) for k, c in top[: out.capacity]}
+        if len(top) > out.capacity:
+            out.floor = int(top[out.capacity - 1][1])
+        return out
+
+    def update(self, values: Iterable) -> "SpaceSaving":
+        "Add the values of a chunk (NaN skipped), in place"
+        values = pd.Series(values)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+        else:
+            codes, uniques = pd.factorize(values)
+        hist = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        seen = hist > 0
+        chunk = SpaceSaving.from_counts(dict(zip(uniques[seen], hist[seen])), self.epsilon)
+        merged = self.merge(chunk)
+        self.n, self.floor, self.counters = merged.n, merged.floor, merged.counters
+        return self
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        "Summary of the values of both `self` and `other`"
+        out = SpaceSaving(min(self.epsilon, other.epsilon))
+        out.n = self.n + other.n
+        combined: List[Tuple[int, int, Hashable]] = []
+        keys = [*self.counters, *(k for k in other.counters if k not in self.counters)]
+        for key in keys:
+            c1, e1 = self.counters.get(key, (self.floor, self.floor))
+            c2, e2 = other.counters.get(key, (other.floor, other.floor))
+            combined.append((c1 + c2, e1 + e2, key))
+        combined.sort(key=lambda x: -x[0])
+        out.counters = {key: (c, e) for c, e, key in combined[: out.capacity]}
+        dropped = combined[out.capacity :]
+        out.floor = max([self.floor + other.floor] + [c for c, _, _ in dropped[:1]])
+        return out
+
+    def estimate(self, value: Hashable) -> Tuple[int, int]:
+        "Lower and upper bound of the count of `value`"
+        if value in self.counters:
+            count, error = self.counters[value]
+            return count - error, count
+        return 0, self.floor
+
+    def top(self, k: Optional[int] = None) -> List[Tuple[Hashable, int, int]]:
+        "(value, estimated count, error) of the `k` largest estimates, largest first"
+        found = sorted(self.counters.items(), key=lambda x: -x[1][0])[:k]
+        return [(key, c, e) for key, (c, e) in found]
+
+    def frame(self, key: str, count: str) -> pd.DataFrame:
+        "The monitored values and estimated counts, as `counts` makes them"
+        found = self.top()
+        return pd.DataFrame(
+            {
+                key: pd.Series([x[0] for x in found], dtype=object),
+                count: np.array([x[1] for x in found], dtype=np.int64),
+            }
+        )
+
+    def __len__(self) -> int:
+        return len(self.counters)
+
+    def __repr__(self) -> str:
+        return (
+            f"SpaceSaving(epsilon={self.epsilon}, n={self.n},"
+            f" {len(self)}/{self.capacity} counters)"
+        )
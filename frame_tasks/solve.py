@@ -1,11 +1,27 @@
 import click
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from itertools import groupby
-from typing import Iterable, List, Tuple, FrozenSet, Optional, NamedTuple, DefaultDict
+from typing import (
+    DefaultDict,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from simpleai.search import SearchProblem, breadth_first
-from .tasks import CallReqsMap, tasks, RetArg, TaskCaller, BaseData
+from .tasks import CallReqsMap, tasks, task_index, RetArg, TaskCaller, BaseData
+from .search import GoalGraph, astar
+from .plan_cache import plan_cache
+from .execute import FrameHandle, LazyPlan, planned_outputs, run_actions, stream_actions
+from .ragged import explode
+from .result_cache import result_cache
 
 
 MAX_REPEAT_GENERIC_TASK: Optional[int] = 1
@@ -27,12 +43,63 @@ class Action(Action_):
         return [(*x[0], *x[1]) for x in self.CallMap.items()]
 
 
-def actions_given_state(state: State) -> Iterable[Action]:
-    found_actions = []
+# State with each frame's columns as a bitset over `columns`
+BitState = NamedTuple("BitState", [("Vars", Tuple[int, ...]), ("Tasks", Tuple[str, ...])])
 
-    state_vars = state.Vars
-    havevars = dict(map(lambda x: (x[0], list(x[1])), enumerate(state_vars)))
+MAX_DECODED_MASKS = 1 << 16
+
+
+class ColumnTable:
+    "Interned column names; a set of columns is an int with one bit per name"
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.decoded: Dict[int, FrozenSet[str]] = {}
+
+    def bit(self, col: str) -> int:
+        try:
+            return 1 << self.ids[col]
+        except KeyError:
+            self.ids[col] = len(self.names)
+            self.names.append(col)
+            return 1 << self.ids[col]
+
+    def mask(self, cols: Iterable[str]) -> int:
+        out = 0
+        for col in cols:
+            out |= self.bit(col)
+        return out
 
+    def names_of(self, mask: int) -> FrozenSet[str]:
+        try:
+            return self.decoded[mask]
+        except KeyError:
+            pass
+        out = []
+        m, i = mask, 0
+        while m:
+            if m & 1:
+                out.append(self.names[i])
+            m >>= 1
+            i += 1
+        if len(self.decoded) >= MAX_DECODED_MASKS:
+            self.decoded.clear()
+        found = self.decoded[mask] = frozenset(out)
+        return found
+
+    def encode(self, state: State) -> BitState:
+        return BitState(Vars=tuple(map(self.mask, state.Vars)), Tasks=state.Tasks)
+
+    def decode(self, state: BitState) -> State:
+        return State(Vars=tuple(map(self.names_of, state.Vars)), Tasks=state.Tasks)
+
+
+columns = ColumnTable()
+
+
+def ignored_tasks(state: Union[State, BitState]) -> FrozenSet[str]:
+    "Generic tasks that have been repeated MAX_REPEAT_GENERIC_TASK times in `state`"
     ignore_tasks = []
     if MAX_REPEAT_GENERIC_TASK is not None:
         gen_tasks: DefaultDict[str, int] = defaultdict(int)
@@ -41,24 +108,119 @@ def actions_given_state(state: State) -> Iterable[Action]:
                 gen_tasks[taskn] += 1
                 if gen_tasks[taskn] >= MAX_REPEAT_GENERIC_TASK:
                     ignore_tasks.append(taskn)
+    return frozenset(ignore_tasks)
+
+
+def expand_actions(
+    state_masks: Tuple[int, ...], ignore_tasks: FrozenSet[str]
+) -> List[Action]:
+    found_actions = []
+    found_keys = set()
 
-    for key, task in tasks.items():
+    state_vars = tuple(map(columns.names_of, state_masks))
+    have_masks = set(state_masks)
+    havevars = dict(map(lambda x: (x[0], list(x[1])), enumerate(state_vars)))
+
+    for key in task_index.candidates(columns.names_of(or_masks(state_masks))):
         if key not in ignore_tasks:
-            tc = TaskCaller(havevars, for_task=task)
+            tc = TaskCaller(havevars, for_task=tasks[key])
             for callmap, returns in tc.satisfy():
                 for _, vars in groupby(returns, key=lambda x: x[0]):
-                    this_rets = frozenset(map(lambda x: x[1], vars))
-                    if not this_rets in state_vars:
+                    if not columns.mask(map(lambda x: x[1], vars)) in have_masks:
                         break
                 else:
                     continue
-                act = Action(Task=key, CallMap=callmap, Returns=returns)
-                if act not in found_actions:
-                    found_actions.append(act)
+                act_key = (key, tuple(callmap.items()), tuple(returns))
+                if act_key not in found_keys:
+                    found_keys.add(act_key)
+                    found_actions.append(
+                        Action(Task=key, CallMap=callmap, Returns=returns)
+                    )
 
     return found_actions
 
 
+def or_masks(masks: Iterable[int]) -> int:
+    out = 0
+    for m in masks:
+        out |= m
+    return out
+
+
+CacheInfo = NamedTuple(
+    "CacheInfo", [("hits", int), ("misses", int), ("maxsize", int), ("currsize", int)]
+)
+
+
+class ActionCache:
+    """LRU memo of expanded actions.
+
+    States are keyed on their column bitsets sorted into a canonical order, so
+    states holding the same frames in a different order, or reached through
+    a different task history, share one entry. Cached actions refer to the
+    canonical frame order and are renumbered for the state being expanded.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[tuple, List[Action]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.entries))
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def actions(
+        self, state_masks: Tuple[int, ...], ignore_tasks: FrozenSet[str]
+    ) -> List[Action]:
+        if self.maxsize <= 0:
+            return expand_actions(state_masks, ignore_tasks)
+
+        order = sorted(range(len(state_masks)), key=state_masks.__getitem__)
+        canon = tuple(state_masks[i] for i in order)
+        key = (task_index.version, ignore_tasks, canon)
+
+        try:
+            found = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            found = expand_actions(canon, ignore_tasks)
+            self.entries[key] = found
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+        if order == list(range(len(order))):
+            return list(found)
+        return [
+            act._replace(
+                CallMap={(order[i], col): v for (i, col), v in act.CallMap.items()}
+            )
+            for act in found
+        ]
+
+
+action_cache = ActionCache()
+
+
+def actions_given_state(state: State) -> Iterable[Action]:
+    return action_cache.actions(
+        tuple(map(columns.mask, state.Vars)), ignored_tasks(state)
+    )
+
+
 def apply_action(state: State, action: Action) -> State:
     returns = action.Returns
     state2 = []
@@ -78,57 +240,179 @@ def apply_many_actions(state: State, action: Iterable[Action]) -> State:
 
 
 class TaskProblem(SearchProblem):
-    def __init__(self, goal: List[List[str]], initial_vars: List[List[str]]):
-        self.goal = goal
-        init_st = tuple(map(lambda x: frozenset(x), initial_vars))
-
-        super().__init__(initial_state=State(Vars=init_st, Tasks=tuple()))
-
-    def actions(self, state: State) -> Iterable[Action]:
-        return actions_given_state(state)
+    "Search over `BitState`s; `run_search` turns the path back into `State`s"
 
-    def result(self, state: State, action: Action) -> State:
-        return apply_action(state, action)
-
-    def is_goal(self, state: State) -> bool:
-        for x in self.goal:
+    def __init__(
+        self, goal: List[List[str]], initial_vars: List[List[str]], prune: bool = True
+    ):
+        self.goal = goal
+        self.goal_masks = [columns.mask(x) for x in goal]
+        self.graph = GoalGraph(goal)
+        self.h_memo: Dict[int, float] = {}
+        self.prune = prune
+        self.expanded = 0
+        init_st = tuple(map(columns.mask, initial_vars))
+
+        super().__init__(initial_state=BitState(Vars=init_st, Tasks=tuple()))
+
+    def actions(self, state: BitState) -> Iterable[Action]:
+        self.expanded += 1
+        acts = action_cache.actions(state.Vars, ignored_tasks(state))
+        if self.prune:
+            return [act for act in acts if self.graph.is_relevant(act)]
+        return acts
+
+    def result(self, state: BitState, action: Action) -> BitState:
+        state2 = []
+        for _, g in groupby(action.Returns, key=lambda x: x[0]):
+            state2.append(columns.mask(map(lambda x: x[1], g)))
+
+        return BitState(
+            Vars=(*state.Vars, *state2), Tasks=(*state.Tasks, action.Task)
+        )
+
+    def is_goal(self, state: BitState) -> bool:
+        for x in self.goal_masks:
             for y in state.Vars:
-                if all(xx in y for xx in x):
+                if y & x == x:
                     break
             else:
-                break
-        else:
-            return True
-        return False
+                return False
+        return True
 
-    def heuristic(self, state: State) -> int:
-        return 1
+    def heuristic(self, state: BitState) -> float:
+        have = or_masks(state.Vars)
+        try:
+            return self.h_memo[have]
+        except KeyError:
+            h = self.h_memo[have] = self.graph.cost(columns.names_of(have))
+            return h
 
 
 TaskExec = Iterable[Tuple[Optional[Action], State]]
 
 
-def find_path(source: List[List[str]], dest: List[List[str]]) -> TaskExec:
-
-    tp = TaskProblem(goal=dest, initial_vars=source)
-
-    result = breadth_first(tp, graph_search=True)
-    if result:
-        return result.path()
-    return []
+def run_search(problem: TaskProblem, method: str = "astar") -> TaskExec:
+    if method == "astar":
+        path = astar(problem, graph_search=True)
+    elif method == "breadth_first":
+        result = breadth_first(problem, graph_search=True)
+        path = result.path() if result else None
+    else:
+        raise ValueError(f"Unknown search method {method}")
+    return [(act, columns.decode(st)) for act, st in path or []]
+
+
+def find_path(
+    source: List[List[str]],
+    dest: List[List[str]],
+    method: str = "astar",
+    prune: bool = True,
+    use_cache: bool = True,
+) -> TaskExec:
+
+    if use_cache:
+        key = plan_cache.key(source, dest, method, prune, MAX_REPEAT_GENERIC_TASK)
+        path = plan_cache.get(key)
+        if path is not None:
+            return path
+
+    tp = TaskProblem(goal=dest, initial_vars=source, prune=prune)
+    path = run_search(tp, method=method)
+
+    if use_cache:
+        plan_cache.put(key, path)
+    return path
+
+
+def merge_plans(
+    n_sources: int, plans: List[List[Action]]
+) -> Tuple[List[Action], List[List[int]]]:
+    """One plan doing the work of all `plans` on the same sources.
+
+    An action applying a task with the same bindings to the same frames
+    as an earlier one, in any of the plans, is left out and its outputs
+    are taken from the earlier one. Returns the merged actions and, for
+    each plan, the merged index of each of its frames.
+    """
+    merged: List[Action] = []
+    # (task, bindings, returns) -> first merged frame it makes
+    made: Dict[tuple, int] = {}
+    n_frames = n_sources
+    maps = []
+    for plan in plans:
+        frames = list(range(n_sources))
+        for act in plan:
+            callmap = {(frames[i], col): v for (i, col), v in act.CallMap.items()}
+            key = (
+                act.Task,
+                tuple((i, col, arg, repr(var)) for (i, col), (arg, var) in callmap.items()),
+                tuple(act.Returns),
+            )
+            n = planned_outputs(act)
+            start = made.get(key)
+            if start is None:
+                start = made[key] = n_frames
+                merged.append(act._replace(CallMap=callmap))
+                n_frames += n
+            frames.extend(range(start, start + n))
+        maps.append(frames)
+    return merged, maps
 
 
 def perform_actions(
-    sources: List[BaseData], actions: Iterable[Action], return_latest_first=True
+    sources: List[BaseData],
+    actions: Iterable[Action],
+    return_latest_first=True,
+    workers: Optional[int] = None,
+    pool: str = "thread",
+    keep: Optional[Iterable[int]] = None,
+    memory_budget: Optional[int] = None,
+    cache_results: bool = False,
 ) -> Iterable[BaseData]:
+    """Run `actions` on `sources`, appending each output to the data.
+
+    With `workers`, actions whose inputs are ready run concurrently on a
+    "thread" or "process" pool (see `execute.run_actions`); outputs land
+    at the same positions as when run one after another.
+    With `keep`, a list of data indices, every other frame is replaced by
+    None as soon as no remaining action reads it.
+    With `memory_budget`, in bytes, task outputs beyond it are spilled to
+    memory-mapped files (needs pyarrow).
+    With `cache_results`, a task that already ran on the same inputs is
+    not run again, its outputs are read from `result_cache.result_cache`.
+    """
 
     current_data = sources
 
-    with click.progressbar(actions) as actions_:
-        for action in actions_:
-            task = tasks[action.Task]
-            retn = task.call_task(action.CallMap, action.Returns, current_data)
-            current_data.extend(retn)
+    if workers is not None or keep is not None or memory_budget is not None:
+        actions = list(actions)
+        if workers is None:
+            pool = "serial"
+        with click.progressbar(length=len(actions)) as bar:
+            data = run_actions(
+                sources,
+                actions,
+                workers,
+                pool,
+                on_done=lambda _: bar.update(1),
+                keep=keep,
+                memory_budget=memory_budget,
+                cache_results=cache_results,
+            )
+        current_data[:] = data
+    else:
+        with click.progressbar(actions) as actions_:
+            for action in actions_:
+                task = tasks[action.Task]
+                if cache_results:
+                    retn = result_cache.call(
+                        task, action.CallMap, action.Returns, current_data
+                    )
+                else:
+                    retn = task.call_task(action.CallMap, action.Returns, current_data)
+                current_data.extend(retn)
+        current_data[:] = map(explode, current_data)
 
     if return_latest_first:
         return reversed(current_data)
@@ -136,16 +420,122 @@ def perform_actions(
 
 
 def Executor(
-    sources: List[BaseData], build: List[List[str]], show_progress=True
+    sources: List[BaseData],
+    build: List[List[str]],
+    show_progress=True,
+    workers: Optional[int] = None,
+    pool: str = "thread",
+    release: bool = False,
+    memory_budget: Optional[int] = None,
+    cache_results: bool = False,
 ) -> List[BaseData]:
+    """Plan and run the tasks that make the columns of `build`.
+
+    With `release`, only the frames holding the `build` columns are kept,
+    the others in the result are None. With `memory_budget`, in bytes,
+    intermediate frames beyond it wait on disk until a task reads them.
+    With `cache_results`, tasks whose inputs did not change since an
+    earlier run are not run again.
+    """
     source = [[xx for xx in x.columns if isinstance(xx, str)] for x in sources]
 
     path = find_path(source, build)
     if not path:
         raise RuntimeError("Path not found")
 
+    keep = None
+    if release:
+        final = path[-1][1].Vars
+        keep = [
+            next(i for i, have in enumerate(final) if set(goal) <= have)
+            for goal in build
+        ]
+
     res = perform_actions(
-        sources, [act for act, _ in path if act], return_latest_first=False,
+        sources,
+        [act for act, _ in path if act],
+        return_latest_first=False,
+        workers=workers,
+        pool=pool,
+        keep=keep,
+        memory_budget=memory_budget,
+        cache_results=cache_results,
     )
 
     return list(res)
+
+
+def StreamExecutor(
+    sources: List[BaseData], build: List[List[str]], chunk_rows: int = 10_000
+) -> Iterator[Tuple[int, BaseData]]:
+    """Plan the tasks that make the columns of `build` and stream their results.
+
+    Row-local tasks run on `chunk_rows` rows at a time (see
+    `execute.stream_actions`); yields (frame index, chunk) of the frames
+    holding the `build` columns.
+    """
+    source = [[xx for xx in x.columns if isinstance(xx, str)] for x in sources]
+
+    path = find_path(source, build)
+    if not path:
+        raise RuntimeError("Path not found")
+
+    final = path[-1][1].Vars
+    keep = [
+        next(i for i, have in enumerate(final) if set(goal) <= have) for goal in build
+    ]
+    return stream_actions(
+        sources, [act for act, _ in path if act], chunk_rows=chunk_rows, keep=keep
+    )
+
+
+def LazyExecutor(sources: List[BaseData], build: List[List[str]]) -> List[FrameHandle]:
+    """Plan the tasks that make the columns of `build`, without running them.
+
+    Returns a handle per group of `build` columns; `compute()` on a handle
+    runs only the tasks its frame depends on (see `execute.LazyPlan`).
+    """
+    source = [[xx for xx in x.columns if isinstance(xx, str)] for x in sources]
+
+    path = find_path(source, build)
+    if not path:
+        raise RuntimeError("Path not found")
+
+    final = path[-1][1].Vars
+    plan = LazyPlan(list(sources), [act for act, _ in path if act])
+    return [
+        plan.handle(next(i for i, have in enumerate(final) if set(goal) <= have))
+        for goal in build
+    ]
+
+
+def MultiExecutor(
+    sources: List[BaseData], builds: List[List[List[str]]], **kwargs
+) -> List[List[BaseData]]:
+    """Run the plans for several `build`s as one, sharing their common tasks.
+
+    Returns, for each build, the frame holding each of its goal groups.
+    Other keyword arguments go to `perform_actions`.
+    """
+    source = [[xx for xx in x.columns if isinstance(xx, str)] for x in sources]
+
+    plans = []
+    goals = []
+    for build in builds:
+        path = find_path(source, build)
+        if not path:
+            raise RuntimeError(f"Path not found for {build}")
+        plans.append([act for act, _ in path if act])
+        final = path[-1][1].Vars
+        goals.append(
+            [next(i for i, have in enumerate(final) if set(g) <= have) for g in build]
+        )
+
+    actions, maps = merge_plans(len(sources), plans)
+    keep = sorted({m[i] for m, g in zip(maps, goals) for i in g})
+    data = list(
+        perform_actions(
+            list(sources), actions, return_latest_first=False, keep=keep, **kwargs
+        )
+    )
+    return [[data[m[i]] for i in g] for m, g in zip(maps, goals)]
@@ -0,0 +1,123 @@
+"Frames kept on disk while a plan runs"
+
+import json
+import os
+import tempfile
+import weakref
+from typing import List, Optional
+
+import numpy as np
+
+from .ragged import RaggedFrame
+from .tasks import BaseData
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pragma: no cover
+    pa = None
+
+
+# a RaggedFrame is stored as its flat frame, whose schema metadata holds
+# this key, and its parent frame, with the size of each row, next to it
+RAGGED_KEY = b"frame_tasks.ragged"
+PARENT_SUFFIX = ".parent"
+SIZES = "__ragged_sizes__"
+
+
+def require_arrow():
+    if pa is None:
+        raise ImportError("Spilling frames to disk needs pyarrow, `pip install pyarrow`")
+
+
+def frame_nbytes(frame: BaseData) -> int:
+    "Memory held by `frame`, counting the objects in object columns"
+    try:
+        return int(frame.memory_usage(index=True, deep=True).sum())  # type: ignore
+    except AttributeError:
+        return 0
+
+
+class SpilledFrame:
+    """Handle to a frame written to an uncompressed Feather (Arrow IPC) file.
+
+    `load` maps the file instead of reading it, so fixed width columns are
+    not copied. The file is removed with the last reference to the handle.
+    """
+
+    def __init__(self, path: str, columns: List, nbytes: int):
+        self.path = path
+        self.columns = columns
+        self.nbytes = nbytes
+        self._finalizer = weakref.finalize(self, _remove, path)
+
+    def load(self) -> BaseData:
+        return read_frame(self.path)
+
+    def remove(self):
+        self._finalizer()
+
+    def __repr__(self) -> str:
+        return f"SpilledFrame({self.path!r}, {self.nbytes} bytes)"
+
+
+def _remove(path: str):
+    for x in (path, path + PARENT_SUFFIX):
+        try:
+            os.unlink(x)
+        except OSError:
+            pass
+
+
+def write_frame(frame: BaseData, path: str) -> bool:
+    """Write `frame` to an uncompressed Feather file at `path`.
+
+    False, and no file, when Arrow cannot store the frame as it is, e.g.
+    with column names that are not strings or objects of mixed types.
+    A `RaggedFrame` takes a second file, `path` + ".parent".
+    """
+    require_arrow()
+    if not all(isinstance(c, str) for c in frame.columns):
+        return False
+    try:
+        if isinstance(frame, RaggedFrame):
+            _write_ragged(frame, path)
+        else:
+            feather.write_feather(frame, path, compression="uncompressed")
+    except (pa.ArrowException, TypeError, ValueError):
+        _remove(path)
+        return False
+    return True
+
+
+def _write_ragged(frame: RaggedFrame, path: str):
+    parent = frame.parent.assign(**{SIZES: np.diff(frame.offsets)})
+    feather.write_feather(parent, path + PARENT_SUFFIX, compression="uncompressed")
+    table = pa.Table.from_pandas(frame.flat, preserve_index=False)
+    info = json.dumps({"columns": frame.order, "start": frame.start}).encode()
+    table = table.replace_schema_metadata({**table.schema.metadata, RAGGED_KEY: info})
+    feather.write_feather(table, path, compression="uncompressed")
+
+
+def read_frame(path: str) -> BaseData:
+    "Frame of a Feather file, mapped rather than read"
+    table = feather.read_table(path, memory_map=True)
+    info = (table.schema.metadata or {}).get(RAGGED_KEY)
+    if info is None:
+        return table.to_pandas(split_blocks=True)
+    info = json.loads(info)
+    parent = read_frame(path + PARENT_SUFFIX)
+    offsets = np.zeros(len(parent) + 1, dtype=np.int64)  # type: ignore
+    np.cumsum(parent.pop(SIZES).to_numpy(), out=offsets[1:])  # type: ignore
+    flat = table.to_pandas(split_blocks=True)
+    return RaggedFrame(parent, flat, offsets, info["columns"], info["start"])  # type: ignore
+
+
+def spill(frame: BaseData, directory: str, nbytes: int = 0) -> Optional[SpilledFrame]:
+    "Write `frame` under `directory`; None when Arrow cannot store it"
+    fd, path = tempfile.mkstemp(suffix=".feather", dir=directory)
+    os.close(fd)
+    if not write_frame(frame, path):
+        _remove(path)
+        return None
+    return SpilledFrame(path, list(frame.columns), nbytes)
@@ -1,12 +1,29 @@
 "Define tasks"
 
+import functools
+import hashlib
+import inspect
 import re
 import sys
 import warnings
-from copy import copy, deepcopy
+from collections import Counter, OrderedDict, defaultdict
+from copy import deepcopy
 from itertools import groupby
-from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
-
+from typing import (
+    Callable,
+    DefaultDict,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from .ragged import RaggedFrame
 
 ver_maj, ver_min = list(map(int, sys.version.split(".")[:2]))
 if ver_maj == 3 and ver_min < 8:
@@ -20,6 +37,117 @@ tasks: Dict[str, "Task"] = {}
 variable_match_ignore_case = False
 Var_In = Union[re.Pattern, str]
 
+# `{x}`, `{x.1}` or `{x.1.2}`: group 2 of the 1st column bound to argument x
+placeholder = re.compile(r"{(\w+)(?:\.(\d+)(?:\.(\d+))?)?}")
+
+
+def is_dynamic(name: str) -> bool:
+    "Whether a required column name refers to other requirements"
+    return re.search(r"{.*?}", name) is not None
+
+
+MAX_MATCH_CACHE = 1 << 16
+_match_groups: Dict[Tuple[re.Pattern, str], Optional[tuple]] = {}
+
+
+def match_groups(matcher: re.Pattern, col: str) -> Optional[tuple]:
+    "Groups of `matcher` matched at the start of `col`, cached"
+    key = (matcher, col)
+    try:
+        return _match_groups[key]
+    except KeyError:
+        pass
+    m = matcher.match(col)
+    if len(_match_groups) >= MAX_MATCH_CACHE:
+        _match_groups.clear()
+    out = _match_groups[key] = None if m is None else m.groups()
+    return out
+
+
+class NameTemplate:
+    """Column name with `{x.i.j}` references, parsed once.
+
+    `literals` has one more entry than `refs`; a reference (arg, i, j) is
+    replaced with group j of the i-th column bound to argument arg.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        self.literals: List[str] = []
+        self.refs: List[Tuple[str, int, int]] = []
+        pos = 0
+        for m in placeholder.finditer(template):
+            self.literals.append(template[pos : m.start()])
+            arg, var_ind, match_ind = m.groups()
+            self.refs.append((arg, int(var_ind or 0), int(match_ind or 0)))
+            pos = m.end()
+        self.literals.append(template[pos:])
+        self.args = {arg for arg, _, _ in self.refs}
+        self._inverse: Optional[re.Pattern] = None
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def compile(template: str) -> "NameTemplate":
+        return NameTemplate(template)
+
+    def expand(self, req: "CallReqsMap") -> str:
+        if not self.refs:
+            return self.template
+        return self.expand_grouped(group_by_arg(req))
+
+    def expand_grouped(
+        self, by_arg: Dict[str, List[Tuple[str, "Variable"]]]
+    ) -> str:
+        "Expand with the columns bound to each argument, in binding order"
+        if not self.refs:
+            return self.template
+        out = [self.literals[0]]
+        for (arg, var_ind, match_ind), lit in zip(self.refs, self.literals[1:]):
+            try:
+                caller_var, refer_var = by_arg[arg][var_ind]
+            except (KeyError, IndexError):
+                raise NotSolvable()
+            groups = match_groups(refer_var.matcher, caller_var)
+            if groups is None:
+                raise NotSolvable(
+                    f"{self.template} does not match with {refer_var} and {caller_var}"
+                )
+            value = groups[match_ind]
+            if value is None:
+                raise NotSolvable(f"{refer_var} group {match_ind} did not match")
+            out.append(value)
+            out.append(lit)
+        return "".join(out)
+
+    @property
+    def inverse(self) -> re.Pattern:
+        "Regex matching every name the template can expand to, one group per reference"
+        if self._inverse is None:
+            parts = [re.escape(self.literals[0])]
+            seen: List[Tuple[str, int, int]] = []
+            for ref, lit in zip(self.refs, self.literals[1:]):
+                if ref in seen:
+                    parts.append(f"(?P=g{seen.index(ref)})")
+                else:
+                    parts.append(f"(?P<g{len(seen)}>.*)")
+                    seen.append(ref)
+                parts.append(re.escape(lit))
+            self._inverse = re.compile("".join(parts) + r"\Z")
+        return self._inverse
+
+    @property
+    def keys(self) -> List[Tuple[str, int, int]]:
+        "Distinct references, in the order of the groups of `inverse`"
+        return list(OrderedDict.fromkeys(self.refs))
+
+
+def group_by_arg(req: "CallReqsMap") -> Dict[str, List[Tuple[str, "Variable"]]]:
+    "(bound column, requirement) per argument, in binding order"
+    by_arg: Dict[str, List[Tuple[str, "Variable"]]] = {}
+    for (_frame, col), (arg, var) in req.items():
+        by_arg.setdefault(arg, []).append((col, var))
+    return by_arg
+
 
 class Variable:
     def __init__(self, x: Union[str, re.Pattern]):
@@ -27,8 +155,26 @@ class Variable:
             re_f = {"flags": re.I} if variable_match_ignore_case else {}
             self.matcher = re.compile(x, **re_f)
             self.string = x
+            self.is_pat = False
+            if is_dynamic(x):
+                self.template = NameTemplate.compile(x)
         else:
             self.matcher = x
+            self.is_pat = True
+
+    def __setstate__(self, state: dict):
+        # pickles from before `is_pat` was stored
+        state.setdefault("is_pat", "string" not in state)
+        self.__dict__.update(state)
+
+    @staticmethod
+    def resolved(template: "Variable", name: str) -> "Variable":
+        "Dynamic requirement `template` with its references filled in as `name`"
+        var = Variable.__new__(Variable)
+        var.matcher = template.matcher
+        var.string = name
+        var.is_pat = False
+        return var
 
     @staticmethod
     def from_q(x: str) -> "Variable":
@@ -38,22 +184,13 @@ class Variable:
             return Variable(re.compile(x[1:]))
 
     def q_enc(self) -> str:
-        try:
-            return f"S{self.string}"
-        except AttributeError:
+        if self.is_pat:
             return f"M{self.matcher.pattern}"
+        return f"S{self.string}"
 
     def __hash__(self):
         return hash(self.matcher)
 
-    @property
-    def is_pat(self) -> bool:
-        try:
-            self.string
-            return False
-        except AttributeError:
-            return True
-
     def highlight_match(self, x, start_tag, end_tag) -> str:
         if not self.is_pat:
             if x == self.string:
@@ -64,22 +201,98 @@ class Variable:
 
     def __eq__(self, x: object) -> bool:
         if isinstance(x, str):
-            try:
-                return self.string == x
-            except AttributeError:
-                return re.match(self.matcher, x) is not None
+            if self.is_pat:
+                return match_groups(self.matcher, x) is not None
+            return self.string == x
         elif isinstance(x, Variable):
-            try:
-                return self == x.string
-            except AttributeError:
+            if x.is_pat:
                 return x.matcher == self.matcher
+            return self == x.string
         return False
 
     def __repr__(self) -> str:
-        try:
-            return self.string
-        except AttributeError:
+        if self.is_pat:
             return f"P'{self.matcher.pattern}'"
+        return self.string
+
+
+# Inline flags accepted inside a scoped group, e.g. (?i:...)
+_SCOPED_FLAGS = {re.I: "i", re.M: "m", re.S: "s", re.X: "x", re.A: "a"}
+_UNFOLDABLE = re.compile(r"\\[1-9]|\(\?P[=<]")
+
+MAX_MATCH_COLUMN_CACHE = 1 << 16
+
+
+class VariableSet:
+    """Batch matcher over many requirements.
+
+    Literal requirements are looked up in a dict. Pattern requirements are
+    folded into one regex of optional lookaheads with a named group each,
+    so one `match` call tells every pattern that matches a column; patterns
+    that cannot be folded (backreferences, named groups, other flags) are
+    tried one by one. Results are the positions of matching `variables`,
+    cached per column. Dynamic requirements are taken literally.
+    """
+
+    def __init__(self, variables: Iterable[Variable]):
+        self.variables = list(variables)
+        self.literals: DefaultDict[str, List[int]] = defaultdict(list)
+        patterns: List[Tuple[re.Pattern, int]] = []
+        for i, var in enumerate(self.variables):
+            if var.is_pat:
+                patterns.append((var.matcher, i))
+            else:
+                self.literals[var.string].append(i)
+        self.combined, self.folded, self.loose = self._combine(patterns)
+        self.cache: Dict[str, FrozenSet[int]] = {}
+
+    @staticmethod
+    def _combine(
+        patterns: List[Tuple[re.Pattern, int]]
+    ) -> Tuple[Optional[re.Pattern], Dict[str, int], List[Tuple[re.Pattern, int]]]:
+        alts = []
+        folded: Dict[str, int] = {}
+        loose = []
+        for matcher, i in patterns:
+            flags = matcher.flags & ~re.U
+            if (
+                not isinstance(matcher.pattern, str)
+                or _UNFOLDABLE.search(matcher.pattern)
+                or flags & ~sum(_SCOPED_FLAGS)
+            ):
+                loose.append((matcher, i))
+                continue
+            scoped = "".join(v for k, v in _SCOPED_FLAGS.items() if flags & k)
+            group = f"_v{i}"
+            folded[group] = i
+            alts.append(f"(?:(?=(?P<{group}>(?{scoped}:{matcher.pattern}))))?")
+        if not alts:
+            return None, {}, loose
+        try:
+            return re.compile("".join(alts)), folded, loose
+        except re.error:
+            return None, {}, patterns
+
+    def match(self, col: str) -> FrozenSet[int]:
+        "Positions of the variables column `col` satisfies"
+        try:
+            return self.cache[col]
+        except KeyError:
+            pass
+        found = set(self.literals.get(col, ()))
+        if self.combined is not None:
+            m = self.combined.match(col)
+            found.update(
+                i for g, i in self.folded.items() if m.group(g) is not None  # type: ignore
+            )
+        found.update(i for matcher, i in self.loose if matcher.match(col))
+        if len(self.cache) >= MAX_MATCH_COLUMN_CACHE:
+            self.cache.clear()
+        out = self.cache[col] = frozenset(found)
+        return out
+
+    def match_many(self, columns: Iterable[str]) -> Dict[str, FrozenSet[int]]:
+        return {col: self.match(col) for col in columns}
 
 
 @runtime_checkable
@@ -127,15 +340,30 @@ class TaskableFunc(Protocol):
         ...
 
 
+MAX_TASK_BINDINGS = 1024
+
+
 class Task:
     def __init__(self, ref: Optional[str]):
         self.requires: List[CallArg] = []
         self.generates: List[RetArg] = []
+        self.generate_templates: List[Tuple[Optional[int], NameTemplate]] = []
         self.fcode: Optional[TaskableFunc] = None
         self.ref = ref
         self.appends = False
         self.pass_extra: Optional[bool] = None
         self.is_generic_ = False
+        # the function may write into its argument frames, so they are
+        # copied rather than sharing column data with earlier results
+        self.mutates_input = True
+        # how call_task added the input columns to the output of an
+        # appending task: "present", "aligned", "join" or "missing"
+        self.append_paths: Counter = Counter()
+        self.row_local = False
+        self.merge: Optional[Callable[[BaseData, BaseData], BaseData]] = None
+        # the function takes `RaggedFrame`s as they are, not exploded
+        self.ragged = False
+        self.bindings: Dict[tuple, tuple] = {}
 
     def is_generic(self) -> bool:
         if not self.is_generic_:
@@ -152,6 +380,7 @@ class Task:
 
     def add_generates(self, posn: Optional[int], col: str):
         self.generates.append((posn, col))
+        self.generate_templates.append((posn, NameTemplate.compile(col)))
 
     def __repr__(self):
         return f"{self.fname}:{self.requires} -> {self.generates}"
@@ -160,14 +389,52 @@ class Task:
         self.fname = f.__name__
         self.fcode = f
         tasks[self.fname] = self
+        task_index.rebuild()
+
+    def fingerprint(self) -> str:
+        """Hash of the task name, its requires and makes declarations, its
+        flags and its code (with the constants it closes over), with that of
+        its `merge` function"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{self.fname}:{self.ref}".encode())
+        for arg, var in self.requires:
+            kind = "P" if var.is_pat else "S"
+            h.update(f"{arg}:{kind}:{var.matcher.flags}:{var.matcher.pattern}".encode())
+        for posn, col in self.generates:
+            h.update(f"{posn}:{col}".encode())
+        h.update(f"{self.appends}:{self.pass_extra}".encode())
+        h.update(f"{self.mutates_input}:{self.row_local}:{self.ragged}".encode())
+        if self.fcode is not None:
+            f = inspect.unwrap(self.fcode)
+            code_hash(getattr(f, "__code__", None), h)
+            # constants the function closes over, e.g. parameters of a task factory
+            for cell in getattr(f, "__closure__", None) or ():
+                value = cell.cell_contents
+                if isinstance(value, (bool, int, float, str, bytes, type(None))):
+                    h.update(repr(value).encode())
+        if self.merge is not None:
+            h.update(getattr(self.merge, "__qualname__", repr(self.merge)).encode())
+            code_hash(getattr(inspect.unwrap(self.merge), "__code__", None), h)
+        return h.hexdigest()
+
+    def bind(
+        self, req_map: CallReqsMap
+    ) -> Tuple[Dict[Arg, int], Dict[tuple, str], Dict[Arg, List[str]]]:
+        """Frame bound to each argument, the `requires` passed to the function
+        and the columns each argument gets, in the order they are required.
+
+        Worked out once per distinct `req_map`.
+        """
+        key = tuple(
+            (data_i, data_col, arg, var.is_pat, var.matcher.pattern, var.matcher.flags)
+            for (data_i, data_col), (arg, var) in req_map.items()
+        )
+        try:
+            return self.bindings[key]
+        except KeyError:
+            pass
 
-    def call_task(
-        self, req_map: CallReqsMap, expects: List[RetArg], data: List[BaseData]
-    ) -> List[BaseData]:
-
-        if self.fcode is None:
-            raise RuntimeError("Function is not set in task!")
-        kwargs = {}
+        frame_of: Dict[Arg, int] = {}
         reference = {}
         reindex: Dict[Arg, List[str]] = dict(
             map(
@@ -175,15 +442,11 @@ class Task:
                 groupby(self.requires, key=lambda x: x[0]),
             )
         )
-
-        data_pass = {}
         for (data_i, data_col), (arg, arg_col) in req_map.items():
-            data_pass[arg] = copy(data[data_i])
-            ident: Union[re.Pattern, str] = arg_col.matcher
-            try:
-                ident = arg_col.string
-            except AttributeError:
-                pass
+            frame_of[arg] = data_i
+            ident: Union[re.Pattern, str] = (
+                arg_col.matcher if arg_col.is_pat else arg_col.string
+            )
             reference[(arg, ident)] = data_col
             arg_reqs = filter(lambda x: x[0] == arg, self.requires)
             refer_pos = next(
@@ -197,12 +460,30 @@ class Task:
             pos: int = refer_pos[0]
             reindex[arg][pos] = data_col
 
+        if len(self.bindings) >= MAX_TASK_BINDINGS:
+            self.bindings.clear()
+        found = self.bindings[key] = (frame_of, reference, reindex)
+        return found
+
+    def call_task(
+        self, req_map: CallReqsMap, expects: List[RetArg], data: List[BaseData]
+    ) -> List[BaseData]:
+
+        if self.fcode is None:
+            raise RuntimeError("Function is not set in task!")
+        kwargs = {}
+        frame_of, reference, reindex = self.bind(req_map)
+        reference = dict(reference)
+        data_pass = {arg: data[data_i] for arg, data_i in frame_of.items()}
+
         for arg in reindex.keys():
             absent = set(reindex[arg]).difference(data_pass[arg].columns)
             assert all(reindex[arg])
             if absent:
                 warnings.warn(f"Executing {self.fname}: {absent} not found for {arg}")
-            kwargs[arg] = data_pass[arg].reindex(columns=reindex[arg])
+            kwargs[arg] = project(
+                data_pass[arg], reindex[arg], self.mutates_input, self.ragged
+            )
 
         if self.pass_extra is not False:
             if "requires" in kwargs:
@@ -260,21 +541,208 @@ class Task:
                 assert isinstance(output_, BaseData)
                 op_: BaseData = output_
                 if self.appends and len(reindex) == 1:
-                    extras = (
-                        data_pass[arg]
-                        .drop_duplicates(subset=reindex[arg])
-                        .set_index(reindex[arg])
+                    op_, how = append_columns(
+                        op_, data_pass[arg], reindex[arg], self.row_local
                     )
-                    if not extras.empty:
-                        op_ = op_.join(extras, on=reindex[arg])
+                    self.append_paths[how] += 1
                 exp_ = set(map(lambda x: x[1], expects))
                 absent = exp_.difference(op_.columns)
                 if absent:
                     warnings.warn(f"Return from {self.fname}: {absent} not found")
-                output = [output_]
+                output = [op_]
         return output
 
 
+def project(
+    frame: BaseData, columns: List[str], copy_data: bool = False, ragged: bool = False
+) -> BaseData:
+    """`frame` with only `columns`, in that order.
+
+    The columns of a pandas frame are shared, not copied, unless
+    `copy_data`; missing or repeated columns go through `reindex`.
+    A `RaggedFrame` is exploded to `columns` only, or kept ragged with
+    `ragged`.
+    """
+    if isinstance(frame, RaggedFrame):
+        if len(set(columns)) != len(columns) or set(columns).difference(frame.order):
+            return frame.explode().reindex(columns=columns)
+        out = frame.project(columns, ragged)
+        return out.copy() if copy_data else out
+    try:
+        if len(set(columns)) != len(columns) or not frame.columns.is_unique:  # type: ignore
+            raise KeyError
+        out = type(frame)({c: frame[c] for c in columns}, copy=False)  # type: ignore
+    except (KeyError, TypeError, AttributeError):
+        return frame.reindex(columns=columns)
+    if copy_data:
+        return out.copy()
+    return out
+
+
+def is_aligned(output: BaseData, frame: BaseData, keys: List[str], row_local: bool) -> bool:
+    """Whether `output` has the rows of `frame` in the same order.
+
+    That takes the same length, index and `keys` columns, and something
+    tying the rows of `output` to those of `frame`: one of the `keys` in
+    `output`, a `row_local` task, or the index of `frame` itself (or a view
+    of it), which columns computed from `frame` keep and reordering or
+    `reset_index` replace. Equal length and index alone do not tell a
+    reordered output.
+    """
+    shared = [k for k in keys if k in output.columns]
+    return (
+        bool(shared or row_local or output.index.is_(frame.index))  # type: ignore
+        and len(output) == len(frame)  # type: ignore
+        and output.index.equals(frame.index)  # type: ignore
+        and all(output[k].equals(frame[k]) for k in shared)  # type: ignore
+    )
+
+
+def append_columns(
+    output: BaseData, frame: BaseData, keys: List[str], row_local: bool = False
+) -> Tuple[BaseData, str]:
+    """`output` with the columns of input `frame` it lacks, and how they were added.
+
+    When `output` has the rows of `frame` in the same order (see
+    `is_aligned`), the columns are set positionally ("aligned").
+    Otherwise rows are matched on the `keys` in `output` with a hash join
+    ("join"); without any it is left as is ("missing").
+    """
+    out_cols = set(output.columns)
+    missing = [c for c in frame.columns if c not in out_cols]
+    if not missing:
+        return output, "present"
+
+    if isinstance(output, RaggedFrame):
+        parent = output.parent
+        if is_aligned(parent, frame, keys, row_local):
+            parent = parent.copy(deep=False)
+            for c in missing:
+                parent[c] = frame[c].values  # type: ignore
+            order = [*output.order, *missing]
+            out = RaggedFrame(parent, output.flat, output.offsets, order, output.start)
+            return out, "aligned"
+        output = output.explode()
+    if isinstance(frame, RaggedFrame):
+        if is_aligned(output, frame, keys, row_local):
+            return frame.with_flat(output), "aligned"  # type: ignore
+        frame = frame.explode()
+
+    on = [k for k in keys if k in out_cols]
+    if is_aligned(output, frame, keys, row_local):
+        out = output.copy(deep=False)  # type: ignore
+        for c in missing:
+            out[c] = frame[c].values  # type: ignore
+        return out, "aligned"
+    if not on:
+        return output, "missing"
+    extras = frame.drop_duplicates(subset=on).set_index(on)
+    return output.join(extras[[c for c in missing if c not in on]], on=on), "join"
+
+
+def code_hash(code, h) -> None:
+    "Update `h` with the bytecode and constants of `code`, recursing into nested code"
+    if code is None:
+        return
+    h.update(code.co_code)
+    h.update(repr((code.co_names, code.co_varnames)).encode())
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            code_hash(const, h)
+        else:
+            h.update(repr(const).encode())
+
+
+class TaskIndex:
+    """Compiled lookup of registered tasks by the columns they can bind.
+
+    The static requirements of all tasks are matched together by a
+    `VariableSet`, whose positions are the requirement ids.
+    Dynamic requirements (e.g. `{x}.counts`) depend on other bindings
+    and are left to `TaskCaller`.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.rebuild()
+
+    def rebuild(self):
+        self.version += 1
+        # requirement id -> task name
+        self.owner: List[str] = []
+        # requirement id -> (task name, argument, requirement)
+        self.requirements: List[Tuple[str, Arg, Variable]] = []
+        # task name -> static requirement ids
+        self.needs: Dict[str, FrozenSet[int]] = {}
+        self.order: Dict[str, int] = {}
+        self.always: List[str] = []
+        # task name -> (task, requirement id or None per requirement)
+        self.task_req_ids: Dict[str, Tuple["Task", List[Optional[int]]]] = {}
+
+        for pos, (name, task) in enumerate(tasks.items()):
+            self.order[name] = pos
+            req_ids = set()
+            self.task_req_ids[name] = (task, [])
+            for arg, var in task.requires:
+                if not var.is_pat and is_dynamic(var.string):
+                    self.task_req_ids[name][1].append(None)
+                    continue
+                req_id = len(self.owner)
+                self.owner.append(name)
+                self.requirements.append((name, arg, var))
+                self.task_req_ids[name][1].append(req_id)
+                req_ids.add(req_id)
+            self.needs[name] = frozenset(req_ids)
+            if not req_ids:
+                self.always.append(name)
+
+        self.matcher = VariableSet(var for _, _, var in self.requirements)
+        self._fingerprint: Optional[str] = None
+
+    def fingerprint(self) -> str:
+        "Hash over the fingerprints of all registered tasks"
+        if self._fingerprint is None:
+            h = hashlib.blake2b(digest_size=16)
+            for name in sorted(tasks):
+                h.update(tasks[name].fingerprint().encode())
+            self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+    def column_requirements(self, col: str) -> FrozenSet[int]:
+        "Static requirement ids that column `col` satisfies"
+        return self.matcher.match(col)
+
+    def matches(self, columns: Iterable[str]) -> Dict[str, List[Tuple[str, Arg, Variable]]]:
+        "(task name, argument, requirement) of every static requirement each column satisfies"
+        return {
+            col: [self.requirements[i] for i in sorted(ids)]
+            for col, ids in self.matcher.match_many(columns).items()
+        }
+
+    def requirement_ids(self, task: "Task") -> Optional[List[Optional[int]]]:
+        "Requirement ids of a registered `task`, aligned with its requires"
+        try:
+            indexed, ids = self.task_req_ids[task.fname]
+        except (KeyError, AttributeError):
+            return None
+        if indexed is not task or len(ids) != len(task.requires):
+            return None
+        return ids
+
+    def candidates(self, columns: Iterable[str]) -> List[str]:
+        "Tasks whose static requirements are all met by some of `columns`, in registry order"
+        matched: Set[int] = set()
+        for col in columns:
+            matched.update(self.column_requirements(col))
+        touched = set(self.always)
+        touched.update(self.owner[i] for i in matched)
+        found = [name for name in touched if self.needs[name] <= matched]
+        return sorted(found, key=self.order.__getitem__)
+
+
+task_index = TaskIndex()
+
+
 global current_interp_task
 current_interp_task: Optional[Task] = None
 
@@ -297,16 +765,14 @@ class TaskCaller:
         self.mapped: CallReqsMap = {}
         self.satisfied = False
         self.task_generates: List[RetArg] = list(for_task.generates)
+        self.generate_templates = list(for_task.generate_templates)
         self.gen_appends = for_task.appends
         self.task_name = for_task.fname
 
         has_dep_reqs = set()
         for xa, xr in for_task.requires:
-            try:
-                if re.search(r"{.*?}", xr.string):
-                    has_dep_reqs.add(xa)
-            except AttributeError:
-                pass
+            if not xr.is_pat and is_dynamic(xr.string):
+                has_dep_reqs.add(xa)
 
         if for_task.requires and has_dep_reqs == set(
             map(lambda x: x[0], for_task.requires)
@@ -315,102 +781,177 @@ class TaskCaller:
         self.task_requires: List[Tuple[str, Variable]] = sorted(
             for_task.requires, key=lambda x: x[0] not in has_dep_reqs
         )
+        # Requirements are bound in this order, which is also the order of
+        # entries in the CallReqsMap that `{x.i}` references index into
+        self.bind_order = self.task_requires[::-1]
 
         self.len_requires = len(self.task_requires)
+        req_ids = task_index.requirement_ids(for_task)
+        self.req_ids: Optional[List[Optional[int]]] = None
+        if req_ids is not None:
+            self.req_ids = [
+                next(
+                    req_ids[k]
+                    for k, (a, v) in enumerate(for_task.requires)
+                    if a == arg and v is var
+                )
+                for arg, var in self.bind_order
+            ]
 
     def satisfy(self) -> Iterator[Tuple[CallReqsMap, List[RetArg]]]:
         for x in self.satisfy_requires():
-            if len(x) < self.len_requires:
-                continue
             try:
                 y = self.get_generates(x)
             except NotSolvable:
                 continue
             yield (x, y)
 
-    def satisfy_requires(self) -> Iterator[CallReqsMap]:
+    def columns(self) -> Iterator[Tuple[int, int, str]]:
+        "(frame, rank, column) of every column in `have`, ranked in order"
+        rank = 0
+        for frame, cols in self.have.items():
+            for col in cols:
+                yield frame, rank, col
+                rank += 1
+
+    def candidates(self) -> List[Optional[List[Tuple[int, int, str]]]]:
+        "(frame, rank, column) each static requirement can bind; None if dynamic"
+        out: List[Optional[List[Tuple[int, int, str]]]] = []
+        for pos, (_arg, var) in enumerate(self.bind_order):
+            if not var.is_pat and is_dynamic(var.string):
+                out.append(None)
+                continue
+            if self.req_ids is not None:
+                req_id = self.req_ids[pos]
+                found = [
+                    x
+                    for x in self.columns()
+                    if req_id in task_index.column_requirements(x[2])
+                ]
+            else:
+                found = [x for x in self.columns() if var == x[2]]
+            out.append(found)
+        return out
 
-        if self.task_requires:
-            arg, var = self.task_requires.pop()
-            have_items = list(self.have.items())
-            if arg in map(lambda x: x[0], self.mapped.values()):
-                mapped_arg = filter(lambda x: x[1][0] == arg, self.mapped.items())
-                mapped_ind: int = next(mapped_arg)[0][0]
-                have_items = list(filter(lambda x: x[0] == mapped_ind, have_items))
-            for have_arg, ha_vars in have_items:
-                for x in ha_vars:
-                    try:
-                        re.search(r"{.*?}", var.string)
-                    except AttributeError:
-                        pass
-                    else:
-                        try:
-                            var.string = self.replace_name_with_req(
-                                var.string, self.mapped
-                            )
-                        except NotSolvable:
-                            continue
-                    if var == x:
-                        task_req0 = self.task_requires.copy()
-                        z = None
-                        if (have_arg, x) in self.mapped:
-                            z = self.mapped[(have_arg, x)]
-                        self.mapped[(have_arg, x)] = arg, var
-                        for option in self.satisfy_requires():
-                            ret = dict(
-                                [((have_arg, x), (arg, var))] + list(option.items())
-                            )
-                            yield ret
-                        if z:
-                            self.mapped[(have_arg, x)] = z
-                        else:
-                            del self.mapped[(have_arg, x)]
-                        self.task_requires = task_req0
-        else:
+    def satisfy_requires(self) -> Iterator[CallReqsMap]:
+        """Bindings of every requirement to a distinct column.
+
+        Static requirements are tried from the one with fewest candidate
+        columns; a dynamic requirement is resolved as soon as the arguments
+        it refers to are bound, and its only candidates are the columns of
+        that name. All requirements of one argument share a frame. Results
+        come out in the order the requirements were declared to bind.
+        """
+        n = self.len_requires
+        if not n:
             yield {}
+            return
+
+        cands = self.candidates()
+        if any(c == [] for c in cands):
+            return
+
+        order = self.bind_order
+        # a dynamic requirement needs the requirements bound before it of
+        # the arguments its template refers to
+        depends: Dict[int, List[int]] = {}
+        for i, c in enumerate(cands):
+            if c is None:
+                refs = order[i][1].template.args
+                depends[i] = [j for j in range(i) if order[j][0] in refs]
+
+        search: List[int] = []
+        left = set(range(n))
+        while left:
+            ready = [i for i in left if all(j in search for j in depends.get(i, ()))]
+            if not ready:
+                return
+            nxt = min(ready, key=lambda i: (cands[i] is not None, len(cands[i] or ()), i))
+            search.append(nxt)
+            left.remove(nxt)
+
+        by_name: DefaultDict[str, List[Tuple[int, int, str]]] = defaultdict(list)
+        for x in self.columns():
+            by_name[x[2]].append(x)
+
+        bound: List[Optional[Tuple[int, int, str]]] = [None] * n
+        resolved: List[Optional[Variable]] = [None] * n
+        used: Set[Tuple[int, str]] = set()
+        arg_frame: Dict[str, int] = {}
+        arg_count: DefaultDict[str, int] = defaultdict(int)
+        solutions: List[Tuple[tuple, CallReqsMap]] = []
+
+        def options(i: int) -> Iterable[Tuple[int, int, str]]:
+            c = cands[i]
+            if c is not None:
+                return c
+            var = order[i][1]
+            prior: CallReqsMap = {}
+            for j in depends[i]:
+                frame, _, col = bound[j]  # type: ignore
+                prior[(frame, col)] = order[j]
+            try:
+                name = var.template.expand(prior)
+            except NotSolvable:
+                return ()
+            resolved[i] = Variable.resolved(var, name)
+            return by_name.get(name, ())
+
+        def bind(step: int):
+            if step == n:
+                key = tuple(b[1] for b in bound)  # type: ignore
+                cm: CallReqsMap = {}
+                for i in range(n):
+                    frame, _, col = bound[i]  # type: ignore
+                    arg, var = order[i]
+                    cm[(frame, col)] = (arg, resolved[i] or var)
+                solutions.append((key, cm))
+                return
+            i = search[step]
+            arg = order[i][0]
+            fixed = arg_frame.get(arg)
+            for b in options(i):
+                frame, _, col = b
+                if fixed is not None and frame != fixed:
+                    continue
+                if (frame, col) in used:
+                    continue
+                bound[i] = b
+                used.add((frame, col))
+                arg_frame[arg] = frame
+                arg_count[arg] += 1
+                bind(step + 1)
+                arg_count[arg] -= 1
+                if not arg_count[arg]:
+                    del arg_frame[arg]
+                used.discard((frame, col))
+            bound[i] = None
+
+        bind(0)
+        solutions.sort(key=lambda x: x[0])
+        for _, cm in solutions:
+            yield cm
 
     @staticmethod
     def replace_name_with_req(name: str, req: CallReqsMap) -> str:
-        def replace_with_req(m) -> str:
-            grp = iter(m.groups())
-            arg = next(grp)
-            try:
-                var_ind = int(next(grp))
-            except (StopIteration, TypeError):
-                var_ind = 0
-            try:
-                match_ind = int(next(grp))
-            except (StopIteration, TypeError):
-                match_ind = 0
-
-            try:
-                refer = [x for x in req.items() if x[1][0] == arg][var_ind]
-            except IndexError:
-                raise NotSolvable()
-            refer_var: Variable = refer[1][1]
-            _caller_arg, caller_var = refer[0]
-
-            m2 = re.match(refer_var.matcher, caller_var)
-
-            if not m2:
-                raise NotSolvable(
-                    f"{name} does not match with {refer_var} and {caller_var}"
-                )
-            return m2.groups()[match_ind]
-
-        return re.sub(r"{(\w+)(?:\.(\d+)(?:\.(\d+))?)?}", replace_with_req, name)
+        return NameTemplate.compile(name).expand(req)
 
     def get_generates(self, requires_satisfied: CallReqsMap) -> List[RetArg]:
 
         generates = []
-        for (index, c) in self.task_generates:
+        by_arg = group_by_arg(requires_satisfied)
+        for (index, c) in self.generate_templates:
 
-            gen_new = self.replace_name_with_req(c, requires_satisfied)
+            gen_new = c.expand_grouped(by_arg)
             generates.append((index, gen_new))
 
         if self.gen_appends:
-            assert len(set(map(lambda x: x[0], requires_satisfied.keys()))) <= 1
-            cols: List[str] = next(iter(self.have.values()))
+            bound = set(map(lambda x: x[0], requires_satisfied.keys()))
+            assert len(bound) <= 1
+            # the columns of the frame the task reads, whatever order the
+            # frames come in
+            frame = next(iter(bound)) if bound else next(iter(self.have))
+            cols: List[str] = self.have[frame]
             for ind in set(map(lambda x: x[0], generates)):
                 for col in cols:
                     if (ind, col) not in generates:
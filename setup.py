@@ -14,5 +14,6 @@ setup(
         "celery",
         "murmurhash3",
     ],
+    extras_require={"spill": ["pyarrow"]},
     version="0.1.0",
 )
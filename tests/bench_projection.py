@@ -0,0 +1,61 @@
+"Bytes allocated to build the arguments of one call_task on a large frame"
+
+import re
+import sys
+import tracemalloc
+import warnings
+from copy import copy
+
+import numpy as np
+import pandas as pd
+
+import frame_tasks as tada
+from frame_tasks.tasks import TaskCaller, tasks
+
+warnings.simplefilter("ignore")
+n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+
+
+def add_task(name, mutates_input):
+    def first(x, expects, **kwargs):
+        return x
+
+    first.__name__ = name
+    tada.new_task(mutates_input=mutates_input)(
+        tada.requires([re.compile(r"(.+)\.lines")], arg="x")(
+            tada.makes([f"{{x}}.{name}"], appends=False)(tada.close_task()(first))
+        )
+    )
+
+
+add_task("shared", False)
+add_task("copied", True)
+
+frame = pd.DataFrame(
+    {
+        "a.lines": np.arange(n_rows).astype(str).astype(object),
+        "n": np.arange(n_rows),
+        "r": np.random.rand(n_rows),
+    }
+)
+
+
+def peak(f) -> int:
+    tracemalloc.start()
+    f()
+    _, out = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out
+
+
+def call(name):
+    callmap, returns = next(TaskCaller({0: list(frame.columns)}, tasks[name]).satisfy())
+    return lambda: tasks[name].call_task(callmap, returns, [frame])
+
+
+for label, f in [
+    ("copy + reindex", lambda: copy(frame).reindex(columns=["a.lines"])),
+    ("call_task", call("shared")),
+    ("call_task mutates_input", call("copied")),
+]:
+    print(f"{label:>24}: {peak(f) / 1e6:10.1f} MB peak for {n_rows} rows")
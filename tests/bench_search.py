@@ -0,0 +1,56 @@
+"""Compare nodes expanded by breadth first and A* search on a wide registry
+
+`python bench_search.py [n_extra [n_noise]]` adds `n_extra` tasks filtering
+lines, which can lead to the goal, and `n_noise` tasks reading paths,
+which cannot and are pruned.
+"""
+
+import re
+import sys
+
+import frame_tasks as tada
+import frame_tasks.basic_tasks
+from frame_tasks.search import benchmark
+
+# each added task multiplies the states unpruned breadth first search
+# goes through: with one it takes about a minute, with two several
+n_extra = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+n_noise = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+
+def add_filter(i):
+    def filter_lines(x, expects, **kwargs):
+        return x
+
+    filter_lines.__name__ = f"filter_{i}"
+    tada.new_task(mutates_input=False)(
+        tada.requires([re.compile(r"(.+\.lines)")], arg="x")(
+            tada.makes([f"{{x}}.filter_{i}"])(tada.close_task()(filter_lines))
+        )
+    )
+
+
+def add_noise(i):
+    def noise(x, expects, **kwargs):
+        return x
+
+    noise.__name__ = f"noise_{i}"
+    tada.new_task(mutates_input=False)(
+        tada.requires([re.compile(r"(.*)\.path")], arg="x")(
+            tada.makes([f"{{x}}.noise_{i}"])(tada.close_task()(noise))
+        )
+    )
+
+
+for i in range(n_extra):
+    add_filter(i)
+for i in range(n_noise):
+    add_noise(i)
+
+goal = [["usenet.read_file.lines.clean_tokens.top90"]]
+for prune in [False, True]:
+    for method, res in benchmark([], goal, prune=prune).items():
+        print(
+            f"{method:>14}{' pruned' if prune else '':>7}: {res['expanded']:>7} nodes"
+            f" expanded, {res['seconds']:.3f}s, {res['length']} tasks"
+        )
@@ -0,0 +1,1012 @@
+import re
+
+import pytest
+
+import frame_tasks as tada
+from frame_tasks.tasks import TaskCaller, tasks, task_index
+from frame_tasks.solve import Action, State, actions_given_state, find_path
+
+pat = re.compile
+
+
+@pytest.fixture(autouse=True)
+def cache_directories(tmp_path_factory, monkeypatch):
+    "Plans and results of each test go to its own directories, not the user's"
+    from frame_tasks.plan_cache import plan_cache
+    from frame_tasks.result_cache import result_cache
+
+    caches = tmp_path_factory.mktemp("caches")
+    monkeypatch.setattr(plan_cache, "directory", caches / "plans")
+    monkeypatch.setattr(result_cache, "directory", caches / "results")
+
+
+@pytest.fixture
+def registry():
+    saved = dict(tasks)
+    tasks.clear()
+    task_index.rebuild()
+
+    @tada.new_task()
+    @tada.makes(["usenet.path"], appends=False)
+    @tada.close_task()
+    def get_paths(expects, **kwargs):
+        ...
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.*)\.path")], arg="x")
+    @tada.makes([r"{x}.read_file.multiline"])
+    @tada.close_task()
+    def get_text(x, expects, **kwargs):
+        ...
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.+)\.multiline")], arg="x")
+    @tada.makes([r"{x}.lines"])
+    @tada.close_task()
+    def get_splits(x, expects, **kwargs):
+        ...
+
+    @tada.new_task()
+    @tada.requires(["sample_ind", pat(r"(.+)\.tokens")], arg="x")
+    @tada.makes(["sample_ind", r"{x}.clean_tokens"], appends=False)
+    @tada.close_task()
+    def tokenize_clean(x, requires, expects):
+        ...
+
+    yield tasks
+    tasks.clear()
+    tasks.update(saved)
+    task_index.rebuild()
+
+
+def test_index_candidates(registry):
+    assert task_index.candidates([]) == ["get_paths"]
+    assert task_index.candidates(["usenet.path"]) == ["get_paths", "get_text"]
+    assert "tokenize_clean" not in task_index.candidates(["a.tokens"])
+    assert "tokenize_clean" in task_index.candidates(["sample_ind", "a.tokens"])
+
+
+def test_index_rebuilt_on_register(registry):
+    @tada.new_task()
+    @tada.requires([pat(r"(.+)\.lines")], arg="x")
+    @tada.makes([r"{x}.tokens", "sample_ind"], appends=False)
+    @tada.close_task()
+    def tokenize(x, requires, expects):
+        ...
+
+    assert "tokenize" in task_index.candidates(["a.lines"])
+
+
+def test_actions_given_state(registry):
+    state = State(Vars=(frozenset(["usenet.path"]),), Tasks=tuple())
+    acts = actions_given_state(state)
+    assert [act.Task for act in acts] == ["get_text"]
+
+
+def test_find_path(registry):
+    path = find_path([], [["usenet.read_file.lines"]])
+    assert [act.Task for act, _ in path if act] == [
+        "get_paths",
+        "get_text",
+        "get_splits",
+    ]
+
+
+def test_action_cache_permuted_state(registry):
+    from frame_tasks.solve import action_cache
+
+    action_cache.clear()
+    a = frozenset(["usenet.path"])
+    b = frozenset(["usenet.read_file.multiline", "usenet.path"])
+    acts1 = actions_given_state(State(Vars=(a, b), Tasks=tuple()))
+    acts2 = actions_given_state(State(Vars=(b, a), Tasks=("get_paths",)))
+    assert action_cache.cache_info().hits == 1
+
+    def frames(acts):
+        return sorted((act.Task, sorted(i for i, _ in act.CallMap)) for act in acts)
+
+    swap = {0: 1, 1: 0}
+    assert frames(acts2) == sorted(
+        (task, sorted(swap[i] for i in ind)) for task, ind in frames(acts1)
+    )
+
+
+@pytest.mark.parametrize("first", ["z", "a.lines"])
+def test_appended_columns_of_bound_frame(registry, monkeypatch, first):
+    from frame_tasks import solve
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.+)\.lines")], arg="x")
+    @tada.makes([r"{x}.upper"])
+    @tada.close_task()
+    def upper(x, expects, **kwargs):
+        ...
+
+    # the order column sets are interned in decides the canonical frame order
+    monkeypatch.setattr(solve, "columns", solve.ColumnTable())
+    solve.columns.mask([first])
+    solve.action_cache.clear()
+    state = State(Vars=(frozenset(["z"]), frozenset(["a.lines"])), Tasks=tuple())
+    (act,) = [a for a in actions_given_state(state) if a.Task == "upper"]
+    assert sorted(col for _, col in act.Returns) == ["a.lines", "a.upper"]
+    solve.action_cache.clear()
+
+
+def test_astar_matches_breadth_first(registry):
+    from frame_tasks.search import benchmark
+
+    res = benchmark([], [["usenet.read_file.lines"]])
+    assert res["astar"]["length"] == res["breadth_first"]["length"] == 3
+    assert res["astar"]["expanded"] <= res["breadth_first"]["expanded"]
+
+
+def test_goal_graph_cost(registry):
+    from frame_tasks.search import GoalGraph
+
+    graph = GoalGraph([["usenet.read_file.lines"]])
+    assert graph.cost(frozenset()) == 3
+    assert graph.cost(frozenset(["usenet.path"])) == 2
+    assert graph.cost(frozenset(["usenet.read_file.lines"])) == 0
+
+
+def test_prune_irrelevant_actions(registry):
+    from frame_tasks.solve import TaskProblem
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.*)\.path")], arg="x")
+    @tada.makes([r"{x}.noise"])
+    @tada.close_task()
+    def noise(x, expects, **kwargs):
+        ...
+
+    problem = TaskProblem([["usenet.read_file.lines"]], [["usenet.path"]])
+    assert problem.graph.relevant == {
+        "usenet.read_file.lines",
+        "usenet.read_file.multiline",
+        "usenet.path",
+    }
+    assert [act.Task for act in problem.actions(problem.initial_state)] == ["get_text"]
+
+    problem = TaskProblem([["usenet.read_file.lines"]], [["usenet.path"]], prune=False)
+    assert {act.Task for act in problem.actions(problem.initial_state)} == {
+        "get_text",
+        "noise",
+    }
+
+    # what pruning alone saves breadth first search
+    from frame_tasks.search import benchmark
+
+    found = {
+        prune: benchmark([], [["usenet.read_file.lines"]], ("breadth_first",), prune)
+        for prune in [True, False]
+    }
+    pruned, full = (found[p]["breadth_first"] for p in [True, False])
+    assert pruned["length"] == full["length"] == 3
+    assert pruned["expanded"] < full["expanded"]
+
+
+@pytest.mark.parametrize("method", ["astar", "breadth_first"])
+@pytest.mark.parametrize("prune", [True, False])
+def test_open_requirement_outside_goal_graph(registry, method, prune):
+    from frame_tasks.search import GoalGraph
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.+)\.src")], arg="x")
+    @tada.makes([r"{x}.path.local"], appends=False)
+    @tada.close_task()
+    def localize(x, expects, **kwargs):
+        ...
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.*)\.path")], arg="x")
+    @tada.makes([r"{x}.text"], appends=False)
+    @tada.close_task()
+    def read_it(x, expects, **kwargs):
+        ...
+
+    goal = [["corpus.text"]]
+    graph = GoalGraph(goal)
+    assert graph.cost(frozenset(["corpus.src"])) == 2
+    path = find_path(
+        [["corpus.src"]], goal, method=method, prune=prune, use_cache=False
+    )
+    assert [act.Task for act, _ in path if act] == ["localize", "read_it"]
+
+
+def test_plan_cache(registry, tmp_path, monkeypatch):
+    from frame_tasks.plan_cache import plan_cache
+
+    monkeypatch.setattr(plan_cache, "directory", tmp_path)
+    goal = [["usenet.read_file.lines"]]
+    path = find_path([], goal)
+    assert len(list(tmp_path.glob("*.pkl"))) == 1
+    hits = plan_cache.hits
+    assert [a for a, _ in find_path([], goal)] == [a for a, _ in path]
+    assert plan_cache.hits == hits + 1
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.+)\.multiline")], arg="x")
+    @tada.makes([r"{x}.lines"])
+    @tada.close_task()
+    def get_splits(x, expects, **kwargs):
+        return x
+
+    find_path([], goal)
+    assert plan_cache.hits == hits + 1
+    assert len(list(tmp_path.glob("*.pkl"))) == 2
+
+    # plans others could have written are not loaded
+    tmp_path.chmod(0o777)
+    find_path([], goal)
+    assert plan_cache.hits == hits + 1
+
+
+def test_task_fingerprint_flags(registry):
+    def define(**flags):
+        @tada.new_task(**flags)
+        @tada.requires([pat(r"(.+)\.lines")], arg="x")
+        @tada.makes([r"{x}.length"])
+        @tada.close_task()
+        def length(x, expects, **kwargs):
+            return x
+
+        return tasks["length"].fingerprint()
+
+    found = [
+        define(),
+        define(row_local=True),
+        define(ragged=True),
+        define(mutates_input=False),
+        define(merge=lambda old, new: old),
+        define(merge=lambda old, new: new),
+    ]
+    assert len(set(found)) == len(found)
+    assert define() == found[0]
+
+
+def test_column_table():
+    from frame_tasks.solve import ColumnTable
+
+    table = ColumnTable()
+    m = table.mask(["a", "b"])
+    assert table.mask(["b"]) & m
+    assert not table.mask(["c"]) & m
+    state = State(Vars=(frozenset(["a", "b"]), frozenset(["c"])), Tasks=("t",))
+    assert table.decode(table.encode(state)) == state
+
+
+def test_dynamic_requirements_bind_per_call(registry):
+    from frame_tasks.tasks import TaskCaller
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.+\.clean_tokens)\Z")], arg="x")
+    @tada.requires([r"{x}", r"{x}.counts"], arg="y")
+    @tada.makes([r"{x}.top90"], appends=False)
+    @tada.close_task()
+    def top90(x, y, requires, expects):
+        ...
+
+    for name in ["a.clean_tokens", "b.clean_tokens"]:
+        have = {0: [name], 1: [name, f"{name}.counts"], 2: ["c.clean_tokens.counts"]}
+        found = list(TaskCaller(have, tasks["top90"]).satisfy())
+        assert len(found) == 1
+        callmap, returns = found[0]
+        assert sorted(callmap) == [(0, name), (1, name), (1, f"{name}.counts")]
+        assert returns == [(None, f"{name}.top90")]
+    assert [v for _, v in tasks["top90"].requires][1:] == ["{x}", "{x}.counts"]
+
+
+def test_name_template():
+    from frame_tasks.tasks import NameTemplate, NotSolvable, Variable
+
+    template = NameTemplate.compile("{x}.{y.1}.{x}")
+    assert NameTemplate.compile("{x}.{y.1}.{x}") is template
+    req = {
+        (0, "a.lines"): ("x", Variable(pat(r"(.+)\.lines"))),
+        (1, "b"): ("y", Variable("b")),
+        (1, "c.tokens"): ("y", Variable(pat(r"(.+)\.tokens"))),
+    }
+    assert template.expand(req) == "a.c.a"
+    assert template.inverse.match("a.c.a").groups() == ("a", "c")
+    assert template.inverse.match("a.c.b") is None
+    with pytest.raises(NotSolvable):
+        NameTemplate.compile("{z}").expand(req)
+
+
+def test_variable_set():
+    from frame_tasks.tasks import Variable, VariableSet
+
+    variables = [
+        Variable(pat(r"(.+)\.lines")),
+        Variable("sample_ind"),
+        Variable(pat(r"B", re.I)),
+        Variable(pat(r"(a)\1")),
+    ]
+    vs = VariableSet(variables)
+    assert len(vs.loose) == 1
+    assert vs.match("b.lines") == {0, 2}
+    assert vs.match("sample_ind") == {1}
+    assert vs.match("aa") == {3}
+    for col in ["b.lines", "sample_ind", "aa", "x"]:
+        assert vs.match(col) == {i for i, v in enumerate(variables) if v == col}
+
+
+def test_index_matches(registry):
+    found = task_index.matches(["usenet.path", "a.tokens"])
+    assert [(t, a) for t, a, _ in found["usenet.path"]] == [("get_text", "x")]
+    assert [(t, a) for t, a, _ in found["a.tokens"]] == [("tokenize_clean", "x")]
+
+
+@pytest.fixture
+def pipeline(registry):
+    import pandas as pd
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.+)\.lines")], arg="x")
+    @tada.makes([r"{x}.upper"])
+    @tada.close_task()
+    def upper(x, expects, **kwargs):
+        return x.assign(**{expects[0][1]: x[x.columns[0]].str.upper()})
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.+)\.lines")], arg="x")
+    @tada.makes([r"{x}.length"])
+    @tada.close_task()
+    def length(x, expects, **kwargs):
+        return x.assign(**{expects[0][1]: x[x.columns[0]].str.len()})
+
+    src = pd.DataFrame({"a.lines": ["x", "yy"]})
+    b = pd.DataFrame({"b.lines": ["zzz"]})
+    acts = []
+    for task, frame, col in [
+        ("upper", 0, "a.lines"),
+        ("length", 1, "b.lines"),
+        ("length", 2, "a.lines"),
+    ]:
+        found = TaskCaller({frame: [col]}, tasks[task]).satisfy()
+        callmap, returns = next(found)
+        acts.append(Action(Task=task, CallMap=callmap, Returns=returns))
+    return [src, b], acts
+
+
+@pytest.mark.parametrize("pool", ["thread", "process"])
+def test_parallel_perform_actions(pipeline, pool):
+    from frame_tasks.solve import perform_actions
+
+    sources, acts = pipeline
+    serial = perform_actions(list(sources), acts, return_latest_first=False)
+    parallel = perform_actions(
+        list(sources), acts, return_latest_first=False, workers=2, pool=pool
+    )
+    assert len(serial) == len(parallel) == 5
+    for x, y in zip(serial, parallel):
+        assert x.equals(y)
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_release_dead_frames(pipeline, workers):
+    from frame_tasks.execute import ActionGraph, Liveness
+    from frame_tasks.solve import perform_actions
+
+    sources, acts = pipeline
+    live = Liveness(ActionGraph(2, acts), keep=[-1])
+    assert live.unused() == []
+    assert sorted(live.done(0)) == [0]
+    assert sorted(live.done(1)) == [1, 3]
+    assert sorted(live.done(2)) == [2]
+
+    data = perform_actions(
+        list(sources), acts, return_latest_first=False, workers=workers, keep=[-1]
+    )
+    assert data[:4] == [None] * 4
+    assert list(data[4].columns) == ["a.lines", "a.length", "a.upper"]
+
+
+def test_memory_budget_spills(pipeline, tmp_path):
+    pytest.importorskip("pyarrow")
+    from frame_tasks.execute import run_actions
+    from frame_tasks.storage import SpilledFrame
+
+    sources, acts = pipeline
+    expected = run_actions(list(sources), acts, pool="serial")
+    spilled = []
+    data = run_actions(
+        list(sources),
+        acts,
+        pool="serial",
+        memory_budget=0,
+        spill_dir=str(tmp_path),
+        on_done=lambda _: spilled.append(len(list(tmp_path.glob("*/*.feather")))),
+    )
+    assert max(spilled) > 0
+    # each run spills to a directory of its own, removed when it ends
+    assert list(tmp_path.iterdir()) == []
+    assert not any(isinstance(x, SpilledFrame) for x in data)
+    for x, y in zip(expected[2:], data[2:]):
+        assert x.equals(y)
+
+    # frames no pending action reads are spilled too, without `keep`
+    from frame_tasks.execute import ActionGraph, MemoryBudget
+
+    budget = MemoryBudget(ActionGraph(2, acts), 10, str(tmp_path))
+    frames = [*sources, *expected[2:]]
+    for frame in range(2, 5):
+        budget.add(frame, frames[frame])
+    budget.started.update(range(len(acts)))
+    budget.enforce(frames)
+    assert sum(budget.sizes.values()) <= 10
+    assert all(isinstance(x, SpilledFrame) for x in frames[2:])
+    del frames
+    budget.close()
+
+    data = run_actions(
+        list(sources), acts, pool="serial", keep=[-1], memory_budget=0, spill_dir=str(tmp_path)
+    )
+    assert data[4].equals(expected[4])
+    del data, x, y
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_append_columns():
+    import pandas as pd
+    from frame_tasks.tasks import append_columns
+
+    frame = pd.DataFrame({"k": ["a", "b"], "v": [1, 2]})
+    out, how = append_columns(frame[["k"]].assign(n=[3, 4]), frame, ["k"])
+    assert how == "aligned"
+    assert out.to_dict("list") == {"k": ["a", "b"], "n": [3, 4], "v": [1, 2]}
+
+    exploded = pd.DataFrame({"k": ["b", "a", "a"], "n": [5, 6, 7]})
+    out, how = append_columns(exploded, frame, ["k"])
+    assert how == "join"
+    assert out["v"].tolist() == [2, 1, 1]
+
+    assert append_columns(out, frame, ["k"])[1] == "present"
+    assert append_columns(exploded[["n"]], frame, ["k"])[1] == "missing"
+
+    # without a key, an output is known to be aligned when it keeps the
+    # index of the input or the task is row-local
+    derived = frame["k"].str.upper().rename("u").to_frame()
+    out, how = append_columns(derived, frame, ["k"])
+    assert how == "aligned" and out["v"].tolist() == [1, 2]
+    reordered = derived.iloc[::-1].reset_index(drop=True)
+    assert append_columns(reordered, frame, ["k"])[1] == "missing"
+    reordered = pd.DataFrame({"n": [4, 3]})
+    assert append_columns(reordered, frame, ["k"])[1] == "missing"
+    out, how = append_columns(reordered, frame, ["k"], row_local=True)
+    assert how == "aligned" and out["v"].tolist() == [1, 2]
+
+
+def test_task_arguments_copied(registry):
+    import pandas as pd
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.+)\.text")], arg="x")
+    @tada.makes([r"{x}.alpha"], appends=False)
+    @tada.close_task()
+    def remove_num(x, requires, expects):
+        data = x[x.columns[0]]
+        data.update(data.str.replace(r"\d", "", regex=True))
+        return data.rename(expects[0][1]).to_frame()
+
+    src = pd.DataFrame({"a.text": ["abc123", "x1"]})
+    out = tada.Executor([src], [["a.alpha"]], show_progress=False)
+    assert out[-1]["a.alpha"].tolist() == ["abc", "x"]
+    assert src["a.text"].tolist() == ["abc123", "x1"]
+
+
+def test_stream_actions(registry):
+    import pandas as pd
+    from frame_tasks.execute import stream_actions
+    from frame_tasks.solve import perform_actions
+
+    @tada.new_task(row_local=True)
+    @tada.requires([pat(r"(.+)\.multiline")], arg="x")
+    @tada.makes([r"{x}.lines"])
+    @tada.close_task()
+    def get_splits(x, expects, **kwargs):
+        out = x[x.columns[0]].str.split("\n").explode()
+        out.name = expects[0][1]
+        return x.join(out).reset_index(drop=True)
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.+)\.lines")], arg="x")
+    @tada.makes([r"{x}.counts"], appends=False)
+    @tada.close_task()
+    def count_lines(x, expects, **kwargs):
+        out = x[x.columns[0]].value_counts().sort_index()
+        return out.rename(expects[0][1]).to_frame()
+
+    src = pd.DataFrame({"a.multiline": ["x\ny", "y", "z\nx\nx"]})
+    path = find_path([list(src.columns)], [["a.counts"], ["a.lines"]], use_cache=False)
+    acts = [act for act, _ in path if act]
+    assert [act.Task for act in acts] == ["get_splits", "count_lines"]
+
+    expected = perform_actions([src], acts, return_latest_first=False)
+    got = list(stream_actions([src], acts, chunk_rows=2, keep=[1, 2]))
+    assert [f for f, _ in got] == [1, 1, 2]
+    assert pd.concat([c for f, c in got if f == 1]).equals(expected[1])
+    assert got[-1][1].equals(expected[2])
+
+
+def test_stream_usenet(usenet):
+    import pandas as pd
+
+    # gathered chunks and merged counts keep categorical columns, as a
+    # single call makes them
+    for goal in ["top90", "counts"]:
+        build = [[f"usenet.read_file.lines.clean_tokens.{goal}"]]
+        expected = tada.Executor([], build, show_progress=False)[-1]
+        got = [c for _, c in tada.StreamExecutor([], build, chunk_rows=3)]
+        assert isinstance(expected.iloc[:, 0].dtype, pd.CategoricalDtype)
+        pd.testing.assert_frame_equal(pd.concat(got), expected)
+
+
+def test_result_cache(pipeline, tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    from frame_tasks.result_cache import result_cache
+    from frame_tasks.solve import perform_actions
+
+    monkeypatch.setattr(result_cache, "directory", tmp_path)
+    sources, acts = pipeline
+    first = perform_actions(
+        list(sources), acts, return_latest_first=False, cache_results=True
+    )
+    hits = result_cache.hits
+    again = perform_actions(
+        list(sources), acts, return_latest_first=False, cache_results=True
+    )
+    assert result_cache.hits == hits + 3
+    for x, y in zip(first, again):
+        assert x.equals(y)
+
+    changed = [sources[0], sources[1].assign(**{"b.lines": ["w"]})]
+    perform_actions(changed, acts, return_latest_first=False, cache_results=True)
+    assert result_cache.hits == hits + 5
+
+    # changed in place, the same frame is hashed again
+    changed[1]["b.lines"] = ["v"]
+    perform_actions(changed, acts, return_latest_first=False, cache_results=True)
+    assert result_cache.hits == hits + 7
+
+    monkeypatch.setattr(result_cache, "max_bytes", 0)
+    result_cache.evict()
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.fixture
+def usenet(tmp_path, monkeypatch):
+    "A small 20_newsgroups corpus in the working directory, with the basic tasks"
+    from frame_tasks import basic_tasks  # noqa: F401
+
+    for group in ["a", "b"]:
+        (tmp_path / "20_newsgroups" / group).mkdir(parents=True)
+        for i in range(2):
+            text = f"From: {group}{i}\nSome words, the words of {group}.\n"
+            (tmp_path / "20_newsgroups" / group / str(i)).write_text(text)
+    monkeypatch.chdir(tmp_path)
+
+
+def test_result_cache_usenet(usenet, tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    from frame_tasks.result_cache import result_cache
+
+    monkeypatch.setattr(result_cache, "directory", tmp_path / "results")
+
+    goal = [["usenet.read_file.lines.clean_tokens.top90"]]
+    first = tada.Executor([], goal, show_progress=False, cache_results=True)
+    hits, misses = result_cache.hits, result_cache.misses
+    again = tada.Executor([], goal, show_progress=False, cache_results=True)
+    # ragged outputs (get_splits, tokenize) are cached like the others
+    assert result_cache.misses == misses
+    assert result_cache.hits == hits + len(first)
+    for x, y in zip(first, again):
+        assert x.equals(y)
+
+
+def test_incremental_run(registry):
+    import pandas as pd
+    from frame_tasks.basic_tasks import merge_counts
+    from frame_tasks.incremental import IncrementalRun
+
+    @tada.new_task(row_local=True)
+    @tada.requires([pat(r"(.+)\.multiline")], arg="x")
+    @tada.makes([r"{x}.lines"])
+    @tada.close_task()
+    def get_splits(x, expects, **kwargs):
+        out = x[x.columns[0]].str.split("\n").explode()
+        out.name = expects[0][1]
+        return x.join(out).reset_index(drop=True)
+
+    @tada.new_task(merge=merge_counts)
+    @tada.requires([pat(r"(.+)\.lines")], arg="x")
+    @tada.makes([r"{x}.counts"], appends=False)
+    @tada.close_task()
+    def count_lines(x, expects, **kwargs):
+        out = x[x.columns[0]].value_counts()
+        out.index.name = x.columns[0]
+        return out.rename(expects[0][1]).reset_index()
+
+    src = pd.DataFrame({"a.multiline": ["x\ny", "y"]})
+    path = find_path([list(src.columns)], [["a.counts"]], use_cache=False)
+    run = IncrementalRun([act for act, _ in path if act])
+    run.run([src])
+    assert run.modes == ["full", "full"]
+
+    grown = pd.concat([src, pd.DataFrame({"a.multiline": ["z\nx\nx"]})], ignore_index=True)
+    data = run.run([grown])
+    assert run.modes == ["appended", "merged"]
+    full = IncrementalRun(run.actions).run([grown])
+    assert data[1].equals(full[1])
+    assert dict(data[2].values) == dict(full[2].values) == {"x": 3, "y": 2, "z": 1}
+
+    run.run([grown])
+    assert run.modes == ["kept", "kept"]
+    run.run([grown.iloc[1:]])
+    assert run.modes == ["rerun", "rerun"]
+
+
+def test_lazy_plan(pipeline):
+    from frame_tasks.execute import LazyPlan
+    from frame_tasks.solve import perform_actions
+
+    sources, acts = pipeline
+    expected = perform_actions(list(sources), acts, return_latest_first=False)
+    plan = LazyPlan(list(sources), acts)
+    b_length, a_length = plan.handle(3), plan.handle(-1)
+    assert plan.runs == 0
+    assert b_length.compute().equals(expected[3])
+    assert plan.runs == 1
+    assert plan.data[2:] == [None] * 3
+    assert a_length.compute().equals(expected[4])
+    assert plan.runs == 3
+    assert plan.data[2:] == [None] * 3
+
+
+def test_merge_plans(registry):
+    from frame_tasks.solve import merge_plans
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.*)\.path")], arg="x")
+    @tada.makes([r"{x}.size"])
+    @tada.close_task()
+    def get_size(x, expects, **kwargs):
+        ...
+
+    lines = [act for act, _ in find_path([], [["usenet.read_file.lines"]]) if act]
+    size = [act for act, _ in find_path([], [["usenet.size"]]) if act]
+    actions, maps = merge_plans(0, [lines, size, lines])
+    assert [act.Task for act in actions] == [
+        "get_paths",
+        "get_text",
+        "get_splits",
+        "get_size",
+    ]
+    assert maps == [[0, 1, 2], [0, 3], [0, 1, 2]]
+    assert list(actions[3].CallMap) == [(0, "usenet.path")]
+
+
+def test_multi_executor(pipeline):
+    sources, _ = pipeline
+    (upper,), (length,) = tada.MultiExecutor(
+        list(sources), [[["a.upper"]], [["b.length"]]]
+    )
+    assert upper["a.upper"].tolist() == ["X", "YY"]
+    assert length["b.length"].tolist() == [3]
+
+
+def test_compiled_plan(pipeline):
+    import pandas as pd
+    from frame_tasks.compiled import CompiledPlan
+
+    sources, _ = pipeline
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.+)\.upper\Z")], arg="x")
+    @tada.requires([r"{x}.length"], arg="y")
+    @tada.makes([r"{x}.both"], appends=False)
+    @tada.close_task()
+    def both(x, y, requires, expects):
+        return y.rename(columns={y.columns[0]: expects[0][1]})
+
+    compiled = CompiledPlan.compile([["a.lines"]], [["a.both"]])
+    plan = CompiledPlan.from_bytes(compiled.to_bytes())
+    assert plan.actions == compiled.actions
+    assert [act.Task for act in plan.actions] == ["upper", "length", "both"]
+    batch = [[pd.DataFrame({"a.lines": [x, x * 2]})] for x in ["p", "q"]]
+    (p,), (q,) = plan.run_many(batch, workers=2)
+    assert p["a.both"].tolist() == [1, 2]
+    assert q["a.both"].tolist() == [1, 2]
+
+    with pytest.raises(ValueError):
+        plan.run([sources[1]])
+
+    # payloads are JSON of primitives only, anything else is refused
+    import json
+    import pickle
+    import zlib
+
+    for bad in [
+        zlib.compress(pickle.dumps(None)),
+        zlib.compress(json.dumps([2, [], [], [["x", [], [[0]]]], [], {}]).encode()),
+        b"not compressed",
+    ]:
+        with pytest.raises(ValueError):
+            CompiledPlan.from_bytes(bad)
+
+
+def test_file_reader(tmp_path):
+    import glob
+    import os
+    from frame_tasks.ingest import FileReader
+
+    for group in ["a", "b", ".hidden"]:
+        (tmp_path / group).mkdir()
+        for i in range(3):
+            (tmp_path / group / str(i)).write_bytes(f"{group}{i}\r\nline\rend\n".encode())
+    (tmp_path / "a" / "big").write_bytes(b"x\r\n" * 1000)
+    (tmp_path / "loose").write_text("not in a group")
+
+    reader = FileReader(workers=4, mmap_min_bytes=100, batch=2)
+    paths = reader.scan(str(tmp_path), 2)
+    assert paths == glob.glob(os.path.join(str(tmp_path), "*", "*"))
+    assert reader.read(paths) == [open(p, errors="replace").read() for p in paths]
+    assert reader.stats.files == len(paths) == 7
+    assert reader.stats.bytes == sum(os.path.getsize(p) for p in paths)
+
+
+def test_categorical_tokens():
+    import pandas as pd
+    from frame_tasks import basic_tasks
+
+    lines = pd.DataFrame({"a.lines": ["Hello, World!", "", "the THE (x) e-mail", None]})
+    toks = basic_tasks.tokenize(
+        x=lines, requires={}, expects=[(None, "sample_ind"), (None, "a.tokens")]
+    )
+    assert isinstance(toks["a.tokens"].dtype, pd.CategoricalDtype)
+    plain = lines["a.lines"].str.split(r"\b").explode().str.lower()
+    assert toks["sample_ind"].tolist() == plain.index.tolist()
+    assert toks["a.tokens"].astype(object).equals(plain.reset_index(drop=True))
+
+    clean = basic_tasks.tokenize_clean(
+        x=toks, requires={}, expects=[(None, "sample_ind"), (None, "a.clean_tokens")]
+    )
+    assert clean["sample_ind"].tolist() == [0, 0, 2, 2, 2]
+    assert clean["a.clean_tokens"].tolist() == ["hello", "world", "the", "the", "mail"]
+    assert list(clean["a.clean_tokens"].cat.categories) == ["hello", "world", "the", "mail"]
+
+    # a chunk without any token has an empty vocabulary
+    empty = basic_tasks.map_categories(pd.Categorical([None, None]), lambda v: v.str.lower())
+    assert list(empty.codes) == [-1, -1] and not len(empty.categories)
+    toks = basic_tasks.tokenize(
+        x=lines.iloc[3:], requires={}, expects=[(None, "sample_ind"), (None, "a.tokens")]
+    )
+    assert toks["a.tokens"].isna().all()
+
+
+@pytest.mark.parametrize("dtype", [object, "category"])
+def test_counts_top90(dtype):
+    import pandas as pd
+    from frame_tasks import basic_tasks
+
+    toks = pd.Series(list("abacabadab") + [None], name="t.clean_tokens", dtype=dtype)
+    x = toks.to_frame()
+    y = basic_tasks.counts(
+        x=x,
+        requires={"t.clean_tokens": "t.clean_tokens"},
+        expects=[(None, "t.clean_tokens.counts"), (None, "t.clean_tokens")],
+    )
+    assert y["t.clean_tokens"].tolist() == ["a", "b", "c", "d"]
+    assert y["t.clean_tokens.counts"].tolist() == [5, 3, 1, 1]
+
+    top = basic_tasks.top90(x=x, y=y, requires={}, expects=[(None, "t.top90")])
+    assert list(y.columns) == ["t.clean_tokens", "t.clean_tokens.counts"]
+    # only a and b come before the running count reaches 90%
+    assert top["t.top90"].tolist() == ["a", "b", "a", "a", "b", "a", "a", "b"]
+    assert top.index.tolist() == [0, 1, 2, 4, 5, 6, 8, 9]
+
+
+def test_stream_folds_mergeable_tasks(registry):
+    import pandas as pd
+    from frame_tasks.execute import stream_actions
+    from frame_tasks.solve import perform_actions
+
+    calls = []
+
+    def add_counts(old, new):
+        return old.add(new, fill_value=0).astype(int)
+
+    @tada.new_task(row_local=True)
+    @tada.requires([pat(r"(.+)\.multiline")], arg="x")
+    @tada.makes([r"{x}.lines"])
+    @tada.close_task()
+    def get_splits(x, expects, **kwargs):
+        out = x[x.columns[0]].str.split("\n").explode()
+        out.name = expects[0][1]
+        return x.join(out).reset_index(drop=True)
+
+    @tada.new_task(merge=add_counts)
+    @tada.requires([pat(r"(.+)\.lines")], arg="x")
+    @tada.makes([r"{x}.counts"], appends=False)
+    @tada.close_task()
+    def count_lines(x, expects, **kwargs):
+        calls.append(len(x))
+        out = x[x.columns[0]].value_counts().sort_index()
+        return out.rename(expects[0][1]).to_frame()
+
+    src = pd.DataFrame({"a.multiline": ["x\ny", "y", "z\nx\nx"]})
+    path = find_path([list(src.columns)], [["a.counts"]], use_cache=False)
+    acts = [act for act, _ in path if act]
+    expected = perform_actions([src], acts, return_latest_first=False)
+    calls.clear()
+
+    got = list(stream_actions([src], acts, chunk_rows=2, keep=[2]))
+    assert calls == [3, 3]
+    assert [f for f, _ in got] == [2]
+    assert got[0][1].equals(expected[2])
+
+
+def test_space_saving():
+    import numpy as np
+    import pandas as pd
+    from frame_tasks.sketch import SpaceSaving
+
+    values = np.random.RandomState(0).zipf(1.3, 20000)
+    true = pd.Series(values).value_counts()
+    parts = [SpaceSaving(0.01).update(part) for part in np.array_split(values, 4)]
+    streamed = SpaceSaving(0.01)
+    for part in np.array_split(values, 10):
+        streamed.update(part)
+
+    for found in [parts[0].merge(parts[1]).merge(parts[2].merge(parts[3])), streamed]:
+        assert found.n == len(values)
+        assert len(found) <= found.capacity == 100
+        for value, count in true.items():
+            low, high = found.estimate(value)
+            assert low <= count <= high
+            assert high - count <= 0.01 * len(values)
+        assert [x[0] for x in found.top(3)] == true.index[:3].tolist()
+
+    with pytest.raises(ValueError):
+        SpaceSaving(0)
+
+
+def test_basic_tasks_share_arguments(usenet):
+    import inspect
+
+    basic = [
+        t
+        for t in tasks.values()
+        if inspect.unwrap(t.fcode).__module__ == "frame_tasks.basic_tasks"
+    ]
+    assert basic and not any(t.mutates_input for t in basic)
+
+
+def test_sketch_tasks(usenet):
+    from frame_tasks import basic_tasks
+
+    x = "usenet.read_file.lines.clean_tokens"
+    exact = tada.Executor([], [[f"{x}.top90"]], show_progress=False)[-1]
+    approx = tada.Executor([], [[f"{x}.top90_approx"]], show_progress=False)[-1]
+    # few distinct tokens: the sketch counts them all exactly
+    assert approx[f"{x}.top90_approx"].tolist() == exact[f"{x}.top90"].tolist()
+
+    default = tasks["sketch"].fingerprint()
+    try:
+        basic_tasks.sketch_task(0.5)
+        assert tasks["sketch"].fingerprint() != default
+        (found,) = tada.Executor([], [[f"{x}.sketch"]], show_progress=False)[-1].iloc[0]
+        assert found.epsilon == 0.5 and len(found) <= 2
+        with pytest.raises(ValueError):
+            basic_tasks.sketch_task(0)
+    finally:
+        basic_tasks.sketch_task()
+    assert tasks["sketch"].fingerprint() == default
+
+
+def test_ragged_frame():
+    import numpy as np
+    import pandas as pd
+    from frame_tasks.ragged import RaggedFrame
+    from frame_tasks.tasks import append_columns, project
+
+    parent = pd.DataFrame({"a.text": ["x y", "", None], "a.path": ["p", "q", "r"]})
+    lists = parent["a.text"].str.split(" ")
+    lists[1] = []
+    frame = RaggedFrame.from_lists(parent[["a.text"]], "a.words", lists)
+    frame, how = append_columns(frame, parent, ["a.text"])
+    assert how == "aligned"
+    assert list(frame.offsets) == [0, 2, 3, 4]
+
+    expected = parent[["a.text"]].join(lists.explode().rename("a.words"))
+    expected = expected.reset_index(drop=True).assign(**{"a.path": list("ppqr")})
+    assert frame.explode().equals(expected)
+    words = project(frame, ["a.words"])
+    assert np.shares_memory(words["a.words"].values, frame.flat["a.words"].values)
+    copied = project(frame, ["a.words", "a.path"], copy_data=True, ragged=True)
+    assert not np.shares_memory(copied.flat["a.words"].values, frame.flat["a.words"].values)
+    assert not np.shares_memory(copied.parent["a.path"].values, frame.parent["a.path"].values)
+
+    upper = words.assign(**{"a.upper": words["a.words"].str.upper()})
+    upper, how = append_columns(upper, frame, ["a.words"])
+    assert how == "aligned" and isinstance(upper, RaggedFrame)
+    assert list(upper.columns) == ["a.words", "a.upper", "a.text", "a.path"]
+    assert upper["a.path"].tolist() == list("ppqr")
+
+
+def test_ragged_tasks(registry):
+    import pandas as pd
+    from frame_tasks.ragged import RaggedFrame
+
+    seen = []
+
+    @tada.new_task()
+    @tada.requires([pat(r"(.+)\.multiline")], arg="x")
+    @tada.makes([r"{x}.lines"])
+    @tada.close_task()
+    def get_splits(x, expects, **kwargs):
+        lines = x[x.columns[0]].str.split("\n")
+        return RaggedFrame.from_lists(x, expects[0][1], lines)
+
+    @tada.new_task(row_local=True)
+    @tada.requires([pat(r"(.+)\.lines")], arg="x")
+    @tada.makes([r"{x}.length"])
+    @tada.close_task()
+    def length(x, expects, **kwargs):
+        seen.append(type(x))
+        return x.assign(**{expects[0][1]: x[x.columns[0]].str.len()})
+
+    @tada.new_task(ragged=True)
+    @tada.requires([pat(r"(.+)\.length")], arg="x")
+    @tada.makes([r"{x}.longest"], appends=False)
+    @tada.close_task()
+    def longest(x, expects, **kwargs):
+        seen.append(type(x))
+        col = x.flat[x.columns[0]].to_numpy()
+        out = [col[a:b].max() for a, b in zip(x.offsets[:-1], x.offsets[1:])]
+        return pd.DataFrame({expects[0][1]: out})
+
+    src = pd.DataFrame({"a.multiline": ["x\nyy", "zzz"], "a.id": [1, 2]})
+    out = tada.Executor([src], [["a.length"], ["a.longest"]])
+    assert seen == [pd.DataFrame, RaggedFrame]
+    assert isinstance(out[2], pd.DataFrame)
+    assert list(out[2].columns) == ["a.lines", "a.length", "a.multiline", "a.id"]
+    assert out[2]["a.id"].tolist() == [1, 1, 2]
+    assert out[2]["a.length"].tolist() == [1, 2, 3]
+    assert out[-1]["a.longest"].tolist() == [2, 3]
+
+    # streamed, `length` runs on chunks of whole parent rows
+    seen.clear()
+    got = list(tada.StreamExecutor([src], [["a.longest"]], chunk_rows=1))
+    assert seen == [pd.DataFrame, pd.DataFrame, RaggedFrame]
+    assert got[-1][1]["a.longest"].tolist() == [2, 3]
+
+    # spilled, `longest` gets the ragged frame mapped back
+    pytest.importorskip("pyarrow")
+    seen.clear()
+    spilled = tada.Executor([src], [["a.length"], ["a.longest"]], memory_budget=0)
+    assert seen == [pd.DataFrame, RaggedFrame]
+    for x, y in zip(out, spilled):
+        assert x.equals(y)
+
+
+def test_ragged_frame_storage(tmp_path):
+    pytest.importorskip("pyarrow")
+    import pandas as pd
+    from frame_tasks.ragged import RaggedFrame
+    from frame_tasks.storage import read_frame, spill, write_frame
+
+    parent = pd.DataFrame({"a.text": ["x y", None, "z"]}, index=[4, 5, 6])
+    frame = RaggedFrame.from_lists(parent, "a.words", parent["a.text"].str.split(" "))
+    frame.flat["a.words"] = frame.flat["a.words"].astype("category")
+    frame.start = 2
+    assert write_frame(frame, str(tmp_path / "0.feather"))
+    back = read_frame(str(tmp_path / "0.feather"))
+    assert isinstance(back, RaggedFrame) and back.start == 2
+    assert back.parent.equals(frame.parent) and back.flat.equals(frame.flat)
+    assert list(back.offsets) == list(frame.offsets)
+
+    handle = spill(frame, str(tmp_path))
+    assert handle.load().explode().equals(frame.explode())
+    del handle
+    assert sorted(x.name for x in tmp_path.iterdir()) == ["0.feather", "0.feather.parent"]